@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Import-time profile of the portal modules, to keep an eye on cold-start cost.
+Each target is imported in a fresh interpreter with `python -X importtime`; the
+report shows the total import time of the target and the heaviest modules it
+pulls in (cumulative time, including their own imports).
+
+Usage (from the repository root):
+    python benchmarks/import_time.py                      # default targets
+    python benchmarks/import_time.py pages.evaluation --top 20
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+VISA_OFFICER_DIR = os.path.join(REPO_ROOT, "visa_officer")
+
+# Imported the way the portals import them: visa officer pages with visa_officer/ as the
+# script directory, everything else from the repository root
+DEFAULT_TARGETS = (
+    "document_processor",
+    "document_processor.scripts.application_analysis",
+    "pages.home",
+    "pages.applications",
+    "pages.evaluation",
+)
+
+
+def profile_import(module):
+    """
+    Import `module` in a fresh interpreter and return [(name, self_us, cumulative_us, depth)]
+    in the order reported by -X importtime, or None if the import failed.
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [VISA_OFFICER_DIR, REPO_ROOT, env.get("PYTHONPATH")]))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        print(f"Error importing {module}:\n{result.stderr.strip().splitlines()[-1]}")
+        return None
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+
+def report(module, entries, top):
+    """Print the total import time of `module` and its `top` heaviest dependencies."""
+    position = max((i for i, entry in enumerate(entries) if entry[0] == module), default=None)
+    if position is None:
+        print(f"{module}: not found in the import profile")
+        return
+    _, _, total, depth = entries[position]
+
+    # -X importtime lists a module after its own imports, indented one level deeper; walk back
+    # over them (and not over the interpreter's startup imports, which come before)
+    dependencies = []
+    for name, _, cumulative, level in reversed(entries[:position]):
+        if level <= depth:
+            break
+        dependencies.append((name, cumulative, level))
+    print(f"{module}: {total / 1000:.1f} ms, {len(dependencies) + 1} modules")
+
+    # Direct imports only, so nothing is counted twice
+    direct = [(name, cumulative) for name, cumulative, level in dependencies if level == depth + 1]
+    for name, cumulative in sorted(direct, key=lambda item: -item[1])[:top]:
+        print(f"    {cumulative / 1000:8.1f} ms  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the import time of the portal modules.")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_TARGETS, help="Modules to profile")
+    parser.add_argument("--top", type=int, default=10, help="Number of heaviest direct imports to list per module")
+    args = parser.parse_args()
+
+    for module in args.modules:
+        entries = profile_import(module)
+        if entries is not None:
+            report(module, entries, args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+SQLite-backed store for candidate credentials and application IDs.
+Each signup or new application ID is a single indexed insert, so signup and login
+cost stays constant regardless of the number of users.
+"""
+
+import os
+import hmac
+import sqlite3
+import hashlib
+import threading
+import toml
+
+STORE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".streamlit", "credentials.db")
+# Legacy TOML file, imported into the store on first use
+LEGACY_CREDENTIALS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".streamlit", "secrets.toml")
+
+# scrypt cost parameters (tunable from the .env file; stored with each hash so they can change later)
+SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+SALT_BYTES = 16
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+
+
+def hash_password(password):
+    """Return a salted scrypt hash in the form 'scrypt$n$r$p$salt$hash'."""
+    salt = os.urandom(SALT_BYTES)
+    derived = hashlib.scrypt(password.encode(), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P,
+                             maxmem=256 * SCRYPT_N * SCRYPT_R)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${derived.hex()}"
+
+
+def verify_password(password, stored_hash):
+    """Check a password against a stored scrypt hash or a legacy unsalted MD5 hash."""
+    if stored_hash.startswith("scrypt$"):
+        _, n, r, p, salt, expected = stored_hash.split("$")
+        n, r, p = int(n), int(r), int(p)
+        derived = hashlib.scrypt(password.encode(), salt=bytes.fromhex(salt), n=n, r=r, p=p,
+                                 maxmem=256 * n * r)
+        return hmac.compare_digest(derived.hex(), expected)
+    return hmac.compare_digest(hashlib.md5(password.encode()).hexdigest(), stored_hash)
+
+
+def needs_rehash(stored_hash):
+    """Return True if the hash is legacy MD5 or uses different cost parameters than configured."""
+    return not stored_hash.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+
+
+def _connect():
+    """Return this thread's connection, creating the database and schema on first use."""
+    global _initialized
+    connection = getattr(_local, "connection", None)
+    if connection is None:
+        os.makedirs(os.path.dirname(STORE_FILE), exist_ok=True)
+        connection = sqlite3.connect(STORE_FILE, timeout=30, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        _local.connection = connection
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                connection.execute("CREATE TABLE IF NOT EXISTS users (email TEXT PRIMARY KEY, password_hash TEXT NOT NULL)")
+                connection.execute("CREATE TABLE IF NOT EXISTS appids (email TEXT PRIMARY KEY, appid TEXT NOT NULL)")
+                _import_legacy_toml(connection)
+                _initialized = True
+    return connection
+
+
+def _import_legacy_toml(connection):
+    """Copy users and app IDs from the legacy secrets.toml into the store (existing rows win)."""
+    if not os.path.exists(LEGACY_CREDENTIALS_FILE):
+        return
+    legacy = toml.load(LEGACY_CREDENTIALS_FILE)
+    connection.execute("BEGIN")
+    connection.executemany("INSERT OR IGNORE INTO users (email, password_hash) VALUES (?, ?)",
+                           legacy.get("users", {}).items())
+    connection.executemany("INSERT OR IGNORE INTO appids (email, appid) VALUES (?, ?)",
+                           legacy.get("appid", {}).items())
+    connection.execute("COMMIT")
+
+
+def create_user(email, password):
+    """Register a new user. Returns False if the email is already registered."""
+    try:
+        _connect().execute("INSERT INTO users (email, password_hash) VALUES (?, ?)", (email, hash_password(password)))
+        return True
+    except sqlite3.IntegrityError:
+        return False
+
+
+def user_exists(email):
+    """Return True if the email is registered."""
+    return _connect().execute("SELECT 1 FROM users WHERE email = ?", (email,)).fetchone() is not None
+
+
+def authenticate(email, password):
+    """
+    Verify a login. Returns "ok", "unknown_email" or "invalid_password".
+    Legacy or outdated hashes are upgraded transparently on successful login.
+    """
+    connection = _connect()
+    row = connection.execute("SELECT password_hash FROM users WHERE email = ?", (email,)).fetchone()
+    if row is None:
+        return "unknown_email"
+    if not verify_password(password, row[0]):
+        return "invalid_password"
+    if needs_rehash(row[0]):
+        connection.execute("UPDATE users SET password_hash = ? WHERE email = ?", (hash_password(password), email))
+    return "ok"
+
+
+def get_appid(email):
+    """Return the application ID stored for the user, or None."""
+    row = _connect().execute("SELECT appid FROM appids WHERE email = ?", (email,)).fetchone()
+    return row[0] if row else None
+
+
+def set_appid(email, appid):
+    """Store (or replace) the application ID for the user."""
+    _connect().execute("INSERT INTO appids (email, appid) VALUES (?, ?) "
+                       "ON CONFLICT(email) DO UPDATE SET appid = excluded.appid", (email, appid))
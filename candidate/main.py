@@ -1,12 +1,18 @@
 import shutil
 import streamlit as st
-import hashlib
-import toml
-import json
 import os
-from datetime import datetime
+import sys
 import pandas as pd
 
+# Make the repository root importable for the document_processor package (only once per process)
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
+from document_processor import assess_image_quality, is_image_file, job_queue
+from uploads import ingest_upload
+import credentials_store
+from storage import app_dir, generate_appid, load_application, save_application, update_application
+
 # Set page configuration
 st.set_page_config(page_title="res[AI]de - Visa Immigration Fast Processing", page_icon="🌍", layout="centered")
 # Display logo in the center
@@ -16,76 +22,58 @@ with cent_co:
         "../assets/logo.png",
         width=200,
     )
-# Paths for saving data
-DATA_FOLDER = "data"
-# File to store user credentials
-CREDENTIALS_FILE = ".streamlit/secrets.toml"
+# Function to check for an existing app ID (looked up once per session)
+def get_existing_appid(user_email):
+    appid_cache = st.session_state.setdefault("appid_cache", {})
+    if user_email not in appid_cache:
+        appid_cache[user_email] = credentials_store.get_appid(user_email)
+    return appid_cache[user_email]
 
-# Function to generate a unique application ID
-def generate_appid(user_email):
-    unique_number = abs(hash(f"{user_email}{datetime.now()}")) % (10 ** 8)
-    return f"APP{unique_number:08d}"
+# Function to save the app ID in the credential store
+def save_appid(user_email, appid):
+    credentials_store.set_appid(user_email, appid)
+    st.session_state.setdefault("appid_cache", {})[user_email] = appid
 
-# Function to check for an existing app ID
-def get_existing_appid(user_email):
-    if os.path.exists(CREDENTIALS_FILE):
-        credentials = toml.load(CREDENTIALS_FILE)
-        return credentials.get("appid", {}).get(user_email, None)
-    return None
-
-# Function to save the app ID in the .toml file
-def save_appid_to_toml(user_email, appid):
-    credentials = {}
-    if os.path.exists(CREDENTIALS_FILE):
-        credentials = toml.load(CREDENTIALS_FILE)
-
-    # Add appid for the user
-    if "appid" not in credentials:
-        credentials["appid"] = {}
-    credentials["appid"][user_email] = appid
-
-    with open(CREDENTIALS_FILE, "w") as file:
-        toml.dump(credentials, file)
-
-# Function to save JSON data locally
+# Function to save the application data locally (creates the date-sharded folder for the appid)
 def save_data_to_json(appid, data):
-    # Create the data folder if it doesn't exist
-    if not os.path.exists(DATA_FOLDER):
-        os.makedirs(DATA_FOLDER)
-
-    # Create the folder for the appid
-    app_folder = os.path.join(DATA_FOLDER, appid)
-    if not os.path.exists(app_folder):
-        os.makedirs(app_folder)
-
-    # Save the JSON file in the appid folder
-    json_path = os.path.join(app_folder, "application_data.json")
-    with open(json_path, "w") as json_file:
-        json.dump(data, json_file, indent=4)
-
-
-# Helper function to hash passwords
-def hash_password(password):
-    return hashlib.md5(password.encode()).hexdigest()
-
-# Function to load credentials from the TOML file
-def load_credentials():
-    if not os.path.exists(CREDENTIALS_FILE):
-        # Create the file if it doesn't exist
-        os.makedirs(os.path.dirname(CREDENTIALS_FILE), exist_ok=True)
-        with open(CREDENTIALS_FILE, "w") as file:
-            toml.dump({}, file)
-    with open(CREDENTIALS_FILE, "r") as file:
-        return toml.load(file)
-
-# Function to save credentials to the TOML file
-def save_credentials(credentials):
-    with open(CREDENTIALS_FILE, "w") as file:
-        toml.dump(credentials, file)
-
-# Helper function to hash passwords
-def hash_password(password):
-    return hashlib.md5(password.encode()).hexdigest()
+    save_application(appid, data)
+
+# Function to get the session's draft of an application
+def load_draft(appid):
+    """
+    Return the in-memory draft of the application for this session.
+    The application record is read only when the draft is first created (or the App ID changes);
+    the form steps edit the draft and write the changed sections back with flush_draft on Next/Finish.
+    """
+    draft = st.session_state.get("draft")
+    if draft is None or draft["appid"] != appid:
+        folder = app_dir(appid) if appid else None
+        data = (load_application(appid) or {}) if appid else {}
+        draft = {"appid": appid, "folder": folder, "data": data, "dirty": set()}
+        st.session_state.draft = draft
+    return draft
+
+# Function to update one section of the draft (and mark it for the next flush)
+def update_draft(draft, section, value):
+    if draft["data"].get(section) != value:
+        draft["data"][section] = value
+        draft["dirty"].add(section)
+
+# Function to write the changed sections of the draft to disk
+def flush_draft(draft):
+    """
+    Write only the sections changed since the last flush, so analyses and status fields
+    written by the worker or an officer in the meantime are kept. A new application
+    (no record yet) is written in full.
+    """
+    if draft["dirty"] and draft["appid"]:
+        try:
+            update_application(draft["appid"], {section: draft["data"][section] for section in draft["dirty"]})
+        except FileNotFoundError:
+            save_data_to_json(draft["appid"], draft["data"])
+        draft["folder"] = app_dir(draft["appid"])
+        draft["dirty"] = set()
+
 
 # Homepage view
 def homepage_view():
@@ -123,16 +111,15 @@ def login_signup_view():
         password = st.text_input("Password", type="password", key="login_password")
 
         if st.button("Login"):
-            if email in st.secrets["users"]:
-                hashed_password = hash_password(password)
-                if st.secrets["users"][email] == hashed_password:
-                    st.session_state.logged_in = True
-                    st.session_state.user_email = email
-                    st.success("Login successful!")
-                    st.session_state["page"] = "account"  # Navigate to Account view
-                    st.rerun()  # Force rerun to update login status
-                else:
-                    st.error("Invalid password. Please try again.")
+            login_result = credentials_store.authenticate(email, password)
+            if login_result == "ok":
+                st.session_state.logged_in = True
+                st.session_state.user_email = email
+                st.success("Login successful!")
+                st.session_state["page"] = "account"  # Navigate to Account view
+                st.rerun()  # Force rerun to update login status
+            elif login_result == "invalid_password":
+                st.error("Invalid password. Please try again.")
             else:
                 st.error("Email not found. Please sign up first.")
 
@@ -146,17 +133,10 @@ def login_signup_view():
                 st.error("Please provide both email and password.")
                 return
 
-            credentials = load_credentials()
-            users = credentials.get("users", {})
-
-            if new_email in users:
+            # Hash the new password and save the user (a single insert; fails if the email exists)
+            if not credentials_store.create_user(new_email, new_password):
                 st.warning("Email already registered. Please login instead.")
             else:
-                # Hash the new password and save the user
-                hashed_password = hash_password(new_password)
-                users[new_email] = hashed_password
-                credentials["users"] = users
-                save_credentials(credentials)
                 st.success("Signup successful! You can now log in.")
                 st.rerun()  # Force rerun to update login status
 
@@ -168,6 +148,8 @@ def account_view():
         if st.button("Logout"):
             st.session_state.logged_in = False
             st.session_state.user_email = ""
+            st.session_state.pop("draft", None)
+            st.session_state.pop("appid_cache", None)
             st.session_state["page"] = "home"
             st.success("You have logged out.")
             st.rerun()
@@ -182,14 +164,8 @@ def account_view():
             st.session_state.appid = existing_appid  # Store the App ID in session state
 
             # Load existing application data
-            app_folder = os.path.join(DATA_FOLDER, existing_appid)
-            json_path = os.path.join(app_folder, "application_data.json")
-            if os.path.exists(json_path):
-                with open(json_path, "r") as json_file:
-                    existing_data = json.load(json_file)
-                application_status = existing_data.get("application_submission", "in_process")
-            else:
-                application_status = "in_process"
+            existing_data = load_draft(existing_appid)["data"]
+            application_status = existing_data.get("application_submission", "in_process")
         else:
             application_status = "in_process"
 
@@ -238,14 +214,14 @@ def account_view():
                 if st.button("Start New Application"):
                     # Delete the old application folder if it exists
                     if existing_appid:
-                        old_app_folder = os.path.join(DATA_FOLDER, existing_appid)
+                        old_app_folder = app_dir(existing_appid)
                         if os.path.exists(old_app_folder):
                             shutil.rmtree(old_app_folder)  # Delete the folder and all its contents
                             st.write(f"Deleted old application data for App ID: {existing_appid}")
 
                     # Generate a new App ID for the user
-                    new_appid = generate_appid(st.session_state.user_email)
-                    save_appid_to_toml(st.session_state.user_email, new_appid)
+                    new_appid = generate_appid()
+                    save_appid(st.session_state.user_email, new_appid)
                     st.session_state.appid = new_appid
 
                     # Redirect to visa selection view
@@ -314,19 +290,10 @@ def personal_info_form(user_email):
 
     # Load existing app ID and data, if available
     appid = st.session_state.get("appid", get_existing_appid(user_email))
-    if appid:
-        app_folder = os.path.join(DATA_FOLDER, appid)
-        json_path = os.path.join(app_folder, "application_data.json")
-        if os.path.exists(json_path):
-            with open(json_path, "r") as json_file:
-                existing_data = json.load(json_file)
-            personal_info = existing_data.get("PersonalInformation", {})
-            purpose_data = existing_data.get("PurposeAndDurationOfStay", {})
-            residence_data = existing_data.get("ResidenceData", {})
-        else:
-            personal_info, purpose_data, residence_data = {}, {}, {}
-    else:
-        personal_info, purpose_data, residence_data = {}, {}, {}
+    draft = load_draft(appid)
+    personal_info = draft["data"].get("PersonalInformation", {})
+    purpose_data = draft["data"].get("PurposeAndDurationOfStay", {})
+    residence_data = draft["data"].get("ResidenceData", {})
 
     # Personal Information Section
     surname = st.text_input("Surname*", value=personal_info.get("Surname", ""), disabled=bool(personal_info.get("Surname")))
@@ -404,16 +371,15 @@ def personal_info_form(user_email):
 
             # Create app ID if it doesn't exist
             if not appid:
-                appid = generate_appid(user_email)
-                save_appid_to_toml(user_email, appid)
-
-            # Ensure the folder for app ID exists
-            app_folder = os.path.join(DATA_FOLDER, appid)
-            if not os.path.exists(app_folder):
-                os.makedirs(app_folder)
+                appid = generate_appid()
+                save_appid(user_email, appid)
+                draft["appid"] = appid
+                draft["dirty"].update(draft["data"])
 
             # Save data to JSON
-            save_data_to_json(appid, updated_data)
+            for section, value in updated_data.items():
+                update_draft(draft, section, value)
+            flush_draft(draft)
 
             # Move to the next step
             st.session_state.current_step = "entry_and_previous_stays"
@@ -426,17 +392,8 @@ def entry_and_previous_stays_form(user_email):
 
     # Load existing app ID and data, if available
     appid = st.session_state.get("appid", get_existing_appid(user_email))
-    if appid:
-        app_folder = os.path.join(DATA_FOLDER, appid)
-        json_path = os.path.join(app_folder, "application_data.json")
-        if os.path.exists(json_path):
-            with open(json_path, "r") as json_file:
-                existing_data = json.load(json_file)
-            entry_stays_data = existing_data.get("EntryAndPreviousStays", {})
-        else:
-            entry_stays_data = {}
-    else:
-        entry_stays_data = {}
+    draft = load_draft(appid)
+    entry_stays_data = draft["data"].get("EntryAndPreviousStays", {})
 
     # Ensure data integrity by checking if keys already exist in the JSON
     first_date_key = "FirstDateOfEntryIntoGermany"
@@ -486,7 +443,7 @@ def entry_and_previous_stays_form(user_email):
     with col_next:
         if st.button("Next", use_container_width=True):
             # Parse stays_abroad text into structured data only if the field is editable
-            stays_abroad_list = entry_stays_data.get(stays_abroad_key, [])
+            stays_abroad_list = list(entry_stays_data.get(stays_abroad_key, []))
             if not entry_stays_data.get(stays_abroad_key) and stays_abroad.strip():
                 for line in stays_abroad.strip().split("\n"):
                     try:
@@ -499,7 +456,7 @@ def entry_and_previous_stays_form(user_email):
                         return
 
             # Parse former_stays text into structured data only if the field is editable
-            former_stays_list = entry_stays_data.get(former_stays_key, [])
+            former_stays_list = list(entry_stays_data.get(former_stays_key, []))
             if not entry_stays_data.get(former_stays_key) and former_stays.strip():
                 for line in former_stays.strip().split("\n"):
                     try:
@@ -511,13 +468,6 @@ def entry_and_previous_stays_form(user_email):
                         st.warning("Invalid format in Former Stays. Please follow the format: Country, Start Date, End Date.")
                         return
 
-            # Load existing data to ensure no overwrite of other sections
-            if os.path.exists(json_path):
-                with open(json_path, "r") as json_file:
-                    data = json.load(json_file)
-            else:
-                data = {}
-
             # Update Entry and Previous Stays data
             updated_entry_stays_data = {
                 first_date_key: str(first_entry),
@@ -525,10 +475,10 @@ def entry_and_previous_stays_form(user_email):
                 stays_abroad_key: stays_abroad_list,
                 former_stays_key: former_stays_list,
             }
-            data["EntryAndPreviousStays"] = updated_entry_stays_data
+            update_draft(draft, "EntryAndPreviousStays", updated_entry_stays_data)
 
             # Save updated data to JSON
-            save_data_to_json(appid, data)
+            flush_draft(draft)
 
             # Move to the next step
             st.session_state.current_step = "legal_info"
@@ -540,17 +490,8 @@ def legal_info_form(user_email):
 
     # Load existing app ID and data, if available
     appid = st.session_state.get("appid", get_existing_appid(user_email))
-    if appid:
-        app_folder = os.path.join(DATA_FOLDER, appid)
-        json_path = os.path.join(app_folder, "application_data.json")
-        if os.path.exists(json_path):
-            with open(json_path, "r") as json_file:
-                existing_data = json.load(json_file)
-            legal_info_data = existing_data.get("LegalViolations", {})
-        else:
-            legal_info_data = {}
-    else:
-        legal_info_data = {}
+    draft = load_draft(appid)
+    legal_info_data = draft["data"].get("LegalViolations", {})
 
     # Prefill form fields with existing data or leave editable if no data
     expelled_deported = st.selectbox(
@@ -638,12 +579,6 @@ def legal_info_form(user_email):
             st.rerun()
     with col_next:
         if st.button("Next", use_container_width=True):
-            # Load existing data
-            app_folder = os.path.join(DATA_FOLDER, appid)
-            json_path = os.path.join(app_folder, "application_data.json")
-            with open(json_path, "r") as json_file:
-                data = json.load(json_file)
-
             # Update Legal Violations data
             updated_legal_info_data = {
                 "ExpelledDeportedOrRepelled": expelled_deported,
@@ -658,10 +593,10 @@ def legal_info_form(user_email):
                 "OwnLongTermResidencePermitEU": long_term_permit,
                 "OwnEUBlueCard": eu_blue_card
             }
-            data["LegalViolations"] = updated_legal_info_data
+            update_draft(draft, "LegalViolations", updated_legal_info_data)
 
             # Save updated data to JSON
-            save_data_to_json(appid, data)
+            flush_draft(draft)
 
             # Move to the next step
             st.session_state.current_step = "livelihood_info"
@@ -674,17 +609,9 @@ def livelihood_info_form(user_email):
 
     # Load existing app ID and data, if available
     appid = st.session_state.get("appid", get_existing_appid(user_email))
-    if appid:
-        app_folder = os.path.join(DATA_FOLDER, appid)
-        json_path = os.path.join(app_folder, "application_data.json")
-        if os.path.exists(json_path):
-            with open(json_path, "r") as json_file:
-                existing_data = json.load(json_file)
-            livelihood_info_data = existing_data.get("LivelihoodInformation", {})
-        else:
-            livelihood_info_data = {}
-    else:
-        livelihood_info_data = {}
+    draft = load_draft(appid)
+    app_folder = draft["folder"]
+    livelihood_info_data = draft["data"].get("LivelihoodInformation", {})
 
     # Prefill form fields with existing data or leave editable if no data
     subsistence_means = st.text_input(
@@ -710,25 +637,34 @@ def livelihood_info_form(user_email):
         key="employer_declaration_doc"
     )
 
-    # Save the uploaded documents locally
+    # Screen passport scans locally so hopeless uploads are rejected before any model sees them
+    passport_rejected = False
+    if passport_doc and is_image_file(passport_doc.name):
+        quality_cache = st.session_state.setdefault("passport_quality", {})
+        if passport_doc.file_id not in quality_cache:
+            quality_cache[passport_doc.file_id] = assess_image_quality(passport_doc)
+            passport_doc.seek(0)
+        passport_quality = quality_cache[passport_doc.file_id]
+        if not passport_quality["acceptable"]:
+            passport_rejected = True
+            st.error("The passport scan could not be accepted. Please upload a clearer scan.\n\n"
+                     + "\n".join(f"- {issue}" for issue in passport_quality["issues"]))
+            passport_doc = None
+        elif passport_quality["issues"]:
+            st.warning("The passport scan was accepted, but its quality may delay processing:\n\n"
+                       + "\n".join(f"- {issue}" for issue in passport_quality["issues"]))
+
+    # Store each upload once (keyed by its file id) and queue new documents for processing
     uploaded_doc_paths = {}
-    if passport_doc:
-        passport_path = os.path.join(app_folder, passport_doc.name)
-        with open(passport_path, "wb") as file:
-            file.write(passport_doc.read())
-        uploaded_doc_paths["Passport"] = passport_path
-
-    if work_contract_doc:
-        work_contract_path = os.path.join(app_folder, work_contract_doc.name)
-        with open(work_contract_path, "wb") as file:
-            file.write(work_contract_doc.read())
-        uploaded_doc_paths["WorkContract"] = work_contract_path
-
-    if employer_declaration_doc:
-        employer_declaration_path = os.path.join(app_folder, employer_declaration_doc.name)
-        with open(employer_declaration_path, "wb") as file:
-            file.write(employer_declaration_doc.read())
-        uploaded_doc_paths["EmployerDeclaration"] = employer_declaration_path
+    previous_uploads = livelihood_info_data.get("UploadedDocuments", {})
+    upload_cache = st.session_state.setdefault("upload_records", {})
+    for doc_key, uploaded_file in (("Passport", passport_doc),
+                                   ("WorkContract", work_contract_doc),
+                                   ("EmployerDeclaration", employer_declaration_doc)):
+        if uploaded_file:
+            previous = previous_uploads.get(doc_key)
+            uploaded_doc_paths[doc_key] = ingest_upload(uploaded_file, app_folder, upload_cache,
+                                                        previous=previous if isinstance(previous, dict) else None)
 
     # Navigation buttons
     col_back, col_next = st.columns([1, 1])
@@ -738,25 +674,28 @@ def livelihood_info_form(user_email):
             st.rerun()
     with col_next:
         if st.button("Finish", use_container_width=True):
-            # Load existing data
-            if os.path.exists(json_path):
-                with open(json_path, "r") as json_file:
-                    data = json.load(json_file)
-            else:
-                data = {}
+            if passport_rejected:
+                st.error("Please upload a passport scan of sufficient quality before finishing.")
+                return
 
             # Save Livelihood Info data
             updated_livelihood_info_data = {
                 "MeansOfSubsistence": subsistence_means,
                 "UploadedDocuments": uploaded_doc_paths if uploaded_doc_paths else livelihood_info_data.get("UploadedDocuments", {})
             }
-            data["LivelihoodInformation"] = updated_livelihood_info_data
+            update_draft(draft, "LivelihoodInformation", updated_livelihood_info_data)
 
             # Set application status to success
-            data["application_submission"] = "success"
+            update_draft(draft, "application_submission", "success")
 
             # Save updated data to JSON
-            save_data_to_json(appid, data)
+            flush_draft(draft)
+
+            # Queue the document analyses so they are ready before an officer opens the application
+            try:
+                job_queue.enqueue("analyze_application", {"appid": appid}, key=appid)
+            except Exception as e:
+                print(f"Error queueing analysis for {appid}: {e}")
 
             # Redirect to success page
             st.session_state["page"] = "success_page"
@@ -786,11 +725,9 @@ def track_application_view():
     # Load existing app ID and data, if available
     appid = st.session_state.get("appid", get_existing_appid(st.session_state.user_email))
     if appid:
-        app_folder = os.path.join(DATA_FOLDER, appid)
-        json_path = os.path.join(app_folder, "application_data.json")
-        if os.path.exists(json_path):
-            with open(json_path, "r") as json_file:
-                existing_data = json.load(json_file)
+        # Only the status fields are needed (officers may have updated them, so read from disk)
+        existing_data = load_application(appid, fields=["application_submission", "final_feedback", "automatic_checks"])
+        if existing_data is not None:
             application_status = existing_data.get("application_submission", "")
             final_feedback = existing_data.get("final_feedback", {})
             automatic_checks = existing_data.get("automatic_checks", {})
@@ -0,0 +1,476 @@
+"""
+On-disk layout of candidate application data.
+
+Application IDs are time-ordered: "APP" followed by a Crockford base32 millisecond
+timestamp (10 chars), a node ID (4 chars) and a per-millisecond counter (4 chars).
+IDs sort by submission time and cannot collide between processes with different
+node IDs. Each application lives in a date-sharded directory derived from its ID,
+e.g. data/2026/10/19/APP01JAB.../, so no single directory grows without bound.
+Legacy numeric IDs (APP12345678) are sharded by a hash prefix instead, e.g.
+data/legacy/3f/APP12345678/. Directories still in the old flat layout are found
+until they are moved with:
+
+    python -m candidate.storage migrate [data_root]
+
+Application records are read and written only through load_application,
+save_application and update_application (or their *_file variants taking a
+directory). The on-disk format is chosen with APPLICATION_STORAGE:
+  - "json" (default): pretty-printed application_data.json
+  - "msgpack": compact application_data.msgpack (requires the msgpack package)
+    with one independently encoded block per top-level field, so single fields
+    can be read or replaced without decoding the rest of the record.
+Records are read from whichever format exists and rewritten in the configured
+one, so switching backends migrates applications as they are saved (or all at
+once with `python -m candidate.storage convert`). Writes go through a temporary
+file unique to each writer, and the read-modify-write of update_application holds
+an flock on the directory's lock file, so the portals and the analysis worker can
+update the same record concurrently.
+"""
+
+import os
+import sys
+import time
+import json
+import random
+import struct
+import hashlib
+import argparse
+import tempfile
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+try:
+    import orjson  # Optional, much faster JSON decoding/encoding
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack  # Optional, compact binary application records
+except ImportError:
+    msgpack = None
+
+try:
+    import fcntl  # Cross-process record locks (POSIX)
+except ImportError:
+    fcntl = None
+
+DATA_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+APPLICATION_FILE = "application_data.json"
+COMPACT_APPLICATION_FILE = "application_data.msgpack"
+LOCK_FILE = ".application.lock"
+
+STORAGE_BACKEND = os.getenv("APPLICATION_STORAGE", "json").lower()
+if STORAGE_BACKEND == "msgpack" and msgpack is None:
+    print("Warning: APPLICATION_STORAGE=msgpack but msgpack is not installed; using JSON.")
+    STORAGE_BACKEND = "json"
+
+# Compact record layout: MAGIC, header length (uint32), msgpack header
+# [SCHEMA_VERSION, [[field, length], ...]], then one msgpack block per field.
+# Known fields are stored by their index in SCHEMA_FIELDS, others by name.
+# SCHEMA_FIELDS is append-only: never reorder or remove entries.
+COMPACT_MAGIC = b"RAPP"
+SCHEMA_VERSION = 1
+SCHEMA_FIELDS = (
+    "application_id", "status", "document_status", "personal_info_status",
+    "criminal_history_status", "officer_notes", "name", "nationality",
+    "submission_date", "visa_type", "application_submission",
+    "PersonalInformation", "PurposeAndDurationOfStay", "ResidenceData",
+    "EntryAndPreviousStays", "LegalViolations", "LivelihoodInformation",
+    "automatic_checks", "final_feedback", "passport_analysis",
+    "contract_analysis", "declaration_analysis", "blue_card_analysis",
+)
+_FIELD_IDS = {name: index for index, name in enumerate(SCHEMA_FIELDS)}
+
+APPID_PREFIX = "APP"
+CROCKFORD_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+TIMESTAMP_CHARS = 10   # 50 bits of milliseconds
+NODE_CHARS = 4         # 20 bits
+COUNTER_CHARS = 4      # 20 bits -> ~1M IDs per millisecond per node
+
+LEGACY_SHARD_ROOT = "legacy"
+LEGACY_SHARD_CHARS = 2  # 256 hash-prefix shards for legacy IDs
+
+# Set APPID_NODE to a distinct value per process/host to make collisions impossible;
+# otherwise a random node ID is chosen at process start.
+NODE_ID = int(os.getenv("APPID_NODE", random.getrandbits(5 * NODE_CHARS))) % (32 ** NODE_CHARS)
+
+_id_lock = threading.Lock()
+_last_timestamp = 0
+_counter = 0
+
+
+def _encode(value, length):
+    chars = []
+    for _ in range(length):
+        value, remainder = divmod(value, 32)
+        chars.append(CROCKFORD_ALPHABET[remainder])
+    return "".join(reversed(chars))
+
+
+def _decode(text):
+    value = 0
+    for char in text:
+        value = value * 32 + CROCKFORD_ALPHABET.index(char)
+    return value
+
+
+def generate_appid():
+    """Return a new, strictly increasing (per process), collision-free application ID."""
+    global _last_timestamp, _counter
+    with _id_lock:
+        timestamp = int(time.time() * 1000)
+        if timestamp <= _last_timestamp:
+            # Same millisecond (or clock went backwards): keep the last timestamp and count up
+            timestamp = _last_timestamp
+            _counter += 1
+            if _counter >= 32 ** COUNTER_CHARS:
+                timestamp += 1
+                _counter = 0
+        else:
+            _counter = 0
+        _last_timestamp = timestamp
+        return (APPID_PREFIX + _encode(timestamp, TIMESTAMP_CHARS)
+                + _encode(NODE_ID, NODE_CHARS) + _encode(_counter, COUNTER_CHARS))
+
+
+def is_time_ordered_appid(appid):
+    """Return True if the ID was produced by `generate_appid` (as opposed to a legacy numeric ID)."""
+    body = appid[len(APPID_PREFIX):]
+    return (appid.startswith(APPID_PREFIX)
+            and len(body) == TIMESTAMP_CHARS + NODE_CHARS + COUNTER_CHARS
+            and all(char in CROCKFORD_ALPHABET for char in body))
+
+
+def appid_timestamp(appid):
+    """Return the UTC creation time encoded in a time-ordered application ID."""
+    millis = _decode(appid[len(APPID_PREFIX):len(APPID_PREFIX) + TIMESTAMP_CHARS])
+    return datetime.fromtimestamp(millis / 1000, tz=timezone.utc)
+
+
+def appid_shard(appid):
+    """Return the relative shard directory for an application ID: YYYY/MM/DD, or legacy/<hash prefix>."""
+    if not is_time_ordered_appid(appid):
+        prefix = hashlib.sha1(appid.encode()).hexdigest()[:LEGACY_SHARD_CHARS]
+        return os.path.join(LEGACY_SHARD_ROOT, prefix)
+    created = appid_timestamp(appid)
+    return os.path.join(f"{created.year:04d}", f"{created.month:02d}", f"{created.day:02d}")
+
+
+def app_dir(appid, data_root=DATA_ROOT):
+    """
+    Return the directory holding an application's data and uploads.
+    Falls back to the old flat location for applications that have not been migrated yet.
+    """
+    sharded = os.path.join(data_root, appid_shard(appid), appid)
+    if not os.path.isdir(sharded):
+        flat = os.path.join(data_root, appid)
+        if os.path.isdir(flat):
+            return flat
+    return sharded
+
+
+def application_json_path(appid, data_root=DATA_ROOT):
+    """Return the path of an application's application_data.json."""
+    return os.path.join(app_dir(appid, data_root), APPLICATION_FILE)
+
+
+def read_json(path):
+    """Parse a JSON file, using orjson when it is installed."""
+    if orjson is not None:
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _read_compact_blocks(path, fields=None):
+    """Return {field: raw msgpack block} from a compact record, reading only the requested fields."""
+    with open(path, "rb") as f:
+        if f.read(len(COMPACT_MAGIC)) != COMPACT_MAGIC:
+            raise ValueError(f"Not a compact application record: {path}")
+        (header_length,) = struct.unpack(">I", f.read(4))
+        version, entries = msgpack.unpackb(f.read(header_length), strict_map_key=False)
+        if version > SCHEMA_VERSION:
+            raise ValueError(f"Unsupported application record version {version}: {path}")
+        blocks = {}
+        for key, length in entries:
+            name = SCHEMA_FIELDS[key] if isinstance(key, int) else key
+            if fields is None or name in fields:
+                blocks[name] = f.read(length)
+            else:
+                f.seek(length, os.SEEK_CUR)
+    return blocks
+
+
+def _write_compact_blocks(f, blocks):
+    entries = [[_FIELD_IDS.get(name, name), len(block)] for name, block in blocks.items()]
+    header = msgpack.packb([SCHEMA_VERSION, entries])
+    f.write(COMPACT_MAGIC + struct.pack(">I", len(header)) + header)
+    for block in blocks.values():
+        f.write(block)
+
+
+def _replace_file(path, write, binary=False):
+    """
+    Write `path` atomically: `write(f)` fills a temporary file unique to this call,
+    which then replaces `path`, so readers never see a partial record and concurrent
+    writers never share a temporary file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb" if binary else "w") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+@contextmanager
+def record_lock(folder):
+    """
+    Hold an exclusive lock on the record in `folder` (an flock on its lock file, shared
+    by every process) for a read-modify-write. Without fcntl, only threads of this
+    process are serialized.
+    """
+    os.makedirs(folder, exist_ok=True)
+    if fcntl is None:
+        with _thread_locks_guard:
+            lock = _thread_locks.setdefault(os.path.abspath(folder), threading.Lock())
+        with lock:
+            yield
+        return
+    with open(os.path.join(folder, LOCK_FILE), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _record_paths(folder):
+    """Return the record files to try in order: the configured format first."""
+    json_path = os.path.join(folder, APPLICATION_FILE)
+    compact_path = os.path.join(folder, COMPACT_APPLICATION_FILE)
+    if STORAGE_BACKEND == "msgpack":
+        return [compact_path, json_path]
+    return [json_path, compact_path] if msgpack is not None else [json_path]
+
+
+def has_application_file(folder):
+    """Return True if the directory holds an application record in any format."""
+    return any(os.path.exists(path) for path in _record_paths(folder))
+
+
+def application_file_mtime(folder):
+    """
+    Return the modification time (ns) of the application record in the directory, or None.
+    Cheap enough to use as a cache key, so cached copies follow writes by other processes.
+    """
+    mtimes = [os.stat(path).st_mtime_ns for path in _record_paths(folder) if os.path.exists(path)]
+    return max(mtimes, default=None)
+
+
+def read_application_file(folder, fields=None):
+    """
+    Read the application record in `folder`, or None if there is none.
+    With `fields`, only those top-level fields are returned (and, for compact
+    records, only those are decoded).
+    """
+    for path in _record_paths(folder):
+        if not os.path.exists(path):
+            continue
+        if path.endswith(COMPACT_APPLICATION_FILE):
+            return {name: msgpack.unpackb(block, strict_map_key=False)
+                    for name, block in _read_compact_blocks(path, fields).items()}
+        data = read_json(path)
+        if fields is not None:
+            data = {name: data[name] for name in fields if name in data}
+        return data
+    return None
+
+
+def _write_record(folder, data):
+    json_path = os.path.join(folder, APPLICATION_FILE)
+    compact_path = os.path.join(folder, COMPACT_APPLICATION_FILE)
+    path, stale_path = (compact_path, json_path) if STORAGE_BACKEND == "msgpack" else (json_path, compact_path)
+
+    if STORAGE_BACKEND == "msgpack":
+        blocks = {name: msgpack.packb(value) for name, value in data.items()}
+        _replace_file(path, lambda f: _write_compact_blocks(f, blocks), binary=True)
+    else:
+        _replace_file(path, lambda f: json.dump(data, f, indent=4))
+    if os.path.exists(stale_path):
+        os.remove(stale_path)
+
+
+def write_application_file(folder, data):
+    """Write a full application record in the configured format (atomically) and drop any stale copy."""
+    with record_lock(folder):
+        _write_record(folder, data)
+
+
+def update_application_file(folder, changes):
+    """
+    Set the given top-level fields of the record in `folder` and return the
+    changed field names. The read-modify-write holds the record lock, so fields
+    written concurrently by other processes are kept. Compact records are updated
+    without decoding the untouched fields. Raises FileNotFoundError if there is no record yet.
+    """
+    with record_lock(folder):
+        compact_path = os.path.join(folder, COMPACT_APPLICATION_FILE)
+        if STORAGE_BACKEND == "msgpack" and os.path.exists(compact_path):
+            blocks = _read_compact_blocks(compact_path)
+            for name, value in changes.items():
+                blocks[name] = msgpack.packb(value)
+            _replace_file(compact_path, lambda f: _write_compact_blocks(f, blocks), binary=True)
+            return list(changes)
+
+        data = read_application_file(folder)
+        if data is None:
+            raise FileNotFoundError(f"No application record in {folder}")
+        data.update(changes)
+        _write_record(folder, data)
+        return list(changes)
+
+
+def load_application(appid, fields=None, data_root=DATA_ROOT):
+    """Read an application's record (optionally only some fields), or None if it has none."""
+    return read_application_file(app_dir(appid, data_root), fields)
+
+
+def save_application(appid, data, data_root=DATA_ROOT):
+    """Write an application's full record, creating its (sharded) directory if needed."""
+    write_application_file(app_dir(appid, data_root), data)
+
+
+def update_application(appid, changes, data_root=DATA_ROOT):
+    """Set some top-level fields of an application's record."""
+    return update_application_file(app_dir(appid, data_root), changes)
+
+
+def _subdirs(path):
+    try:
+        return sorted((entry for entry in os.scandir(path) if entry.is_dir()), key=lambda e: e.name)
+    except FileNotFoundError:
+        return []
+
+
+def list_shards(data_root=DATA_ROOT):
+    """
+    Return every leaf shard directory under `data_root` (date shards in ascending
+    order, then legacy hash shards). Shards can be scanned independently and in parallel.
+    """
+    shards = []
+    for top in _subdirs(data_root):
+        if top.name.isdigit():
+            for month in _subdirs(top.path):
+                shards.extend(day.path for day in _subdirs(month.path))
+        elif top.name == LEGACY_SHARD_ROOT:
+            shards.extend(prefix.path for prefix in _subdirs(top.path))
+    return shards
+
+
+def scan_shard(shard_dir):
+    """Return [(appid, directory), ...] for the applications in one shard."""
+    return [(entry.name, entry.path) for entry in _subdirs(shard_dir)]
+
+
+def _flat_application_dirs(data_root):
+    return [(entry.name, entry.path) for entry in _subdirs(data_root)
+            if not entry.name.isdigit() and entry.name != LEGACY_SHARD_ROOT]
+
+
+def iter_application_dirs(data_root=DATA_ROOT, workers=8):
+    """
+    Yield (appid, directory) for every application under `data_root`, covering
+    the date and legacy shards as well as directories still in the flat layout.
+    Shards are listed in parallel on `workers` threads; time-ordered applications
+    are yielded in ascending submission order.
+    """
+    if not os.path.isdir(data_root):
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for entries in executor.map(scan_shard, list_shards(data_root)):
+            yield from entries
+    yield from _flat_application_dirs(data_root)
+
+
+def _rewrite_upload_paths(app_folder, old_folder):
+    """Point UploadedDocuments entries that referenced the old folder at the new one."""
+    data = read_application_file(app_folder, fields=["LivelihoodInformation"])
+    if not data:
+        return
+    livelihood = data.get("LivelihoodInformation", {})
+    documents = livelihood.get("UploadedDocuments", {})
+    changed = False
+    for key, document in documents.items():
+        path = document.get("path") if isinstance(document, dict) else document
+        if path and os.path.dirname(os.path.abspath(path)) == os.path.abspath(old_folder):
+            new_path = os.path.join(app_folder, os.path.basename(path))
+            if isinstance(document, dict):
+                document["path"] = new_path
+            else:
+                documents[key] = new_path
+            changed = True
+    if changed:
+        update_application_file(app_folder, {"LivelihoodInformation": livelihood})
+
+
+def migrate_flat_layout(data_root=DATA_ROOT):
+    """
+    Move every application directory still in the flat layout into its shard.
+    Returns the number of migrated applications. Safe to re-run.
+    """
+    migrated = 0
+    for appid, old_folder in _flat_application_dirs(data_root):
+        new_folder = os.path.join(data_root, appid_shard(appid), appid)
+        if os.path.exists(new_folder):
+            print(f"Skipping {appid}: {new_folder} already exists")
+            continue
+        os.makedirs(os.path.dirname(new_folder), exist_ok=True)
+        os.rename(old_folder, new_folder)
+        _rewrite_upload_paths(new_folder, old_folder)
+        migrated += 1
+    return migrated
+
+
+def convert_records(data_root=DATA_ROOT):
+    """Rewrite every application record in the configured storage format. Returns the number converted."""
+    converted = 0
+    for appid, folder in iter_application_dirs(data_root):
+        data = read_application_file(folder)
+        if data is not None:
+            write_application_file(folder, data)
+            converted += 1
+    return converted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the candidate application data layout.")
+    parser.add_argument("command", choices=["migrate", "convert"],
+                        help="migrate: move flat application folders into shards; "
+                             "convert: rewrite all records in the APPLICATION_STORAGE format")
+    parser.add_argument("data_root", nargs="?", default=DATA_ROOT)
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.data_root):
+        print(f"Error: Data directory not found: {args.data_root}")
+        sys.exit(1)
+    if args.command == "migrate":
+        migrated = migrate_flat_layout(args.data_root)
+        print(f"Migrated {migrated} application(s) into shards under {args.data_root}")
+    else:
+        converted = convert_records(args.data_root)
+        print(f"Converted {converted} application record(s) to {STORAGE_BACKEND} under {args.data_root}")
+
+
+if __name__ == "__main__":
+    main()
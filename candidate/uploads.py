@@ -0,0 +1,87 @@
+"""
+Upload ingestion for the candidate portal: writes uploaded documents to disk once
+per upload, skips rewrites when the content is unchanged and hands new documents to
+a background worker for preprocessing.
+"""
+
+import os
+import hashlib
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor
+from document_processor import is_image_file, get_preprocessed_image, get_image_pyramid
+
+# Imported modules survive Streamlit reruns, so this pool is shared by all sessions
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="upload-processing")
+
+
+def hash_upload(uploaded_file):
+    """Return the SHA-256 hex digest of an uploaded file."""
+    return hashlib.sha256(uploaded_file.getbuffer()).hexdigest()
+
+
+def store_upload(uploaded_file, folder, previous=None):
+    """
+    Write an uploaded file into `folder`. Streamlit already holds the whole upload in
+    memory, so its buffer is written directly without another copy.
+    The file is only written if its content differs from the `previous` record.
+
+    Returns:
+        tuple: (record, changed) where record is a dict with "path", "size",
+        "sha256" and "mime", and changed is True if the file was (re)written.
+    """
+    path = os.path.join(folder, os.path.basename(uploaded_file.name))
+    sha256 = hash_upload(uploaded_file)
+    if previous and previous.get("path") == path and previous.get("sha256") == sha256 and os.path.exists(path):
+        return previous, False
+
+    # Write to a temporary file first so readers never see a partial document
+    buffer = uploaded_file.getbuffer()
+    tmp_path = f"{path}.part"
+    with open(tmp_path, "wb") as file:
+        file.write(buffer)
+    os.replace(tmp_path, path)
+
+    record = {
+        "path": path,
+        "size": len(buffer),
+        "sha256": sha256,
+        "mime": uploaded_file.type or mimetypes.guess_type(path)[0] or "application/octet-stream",
+    }
+    return record, True
+
+
+def process_document(record):
+    """Background processing for a stored document (for images: scan preprocessing and the zoom view pyramid)."""
+    if is_image_file(record["path"]):
+        get_preprocessed_image(record["path"])
+        get_image_pyramid(record["path"])
+
+
+def _log_failure(record, future):
+    error = future.exception()
+    if error is not None:
+        print(f"Error processing uploaded document {record['path']}: {error}")
+
+
+def enqueue_document(record):
+    """Schedule background processing for a newly stored document; failures are logged."""
+    future = _executor.submit(process_document, record)
+    future.add_done_callback(lambda done: _log_failure(record, done))
+    return future
+
+
+def ingest_upload(uploaded_file, folder, session_cache, previous=None):
+    """
+    Store an upload once and return its record.
+    `session_cache` (e.g. a dict in st.session_state) maps the upload's file_id to its
+    record, so reruns with the same upload do no hashing, no disk I/O and no processing.
+    """
+    cached = session_cache.get(uploaded_file.file_id)
+    if cached and os.path.exists(cached["path"]):
+        return cached
+
+    record, changed = store_upload(uploaded_file, folder, previous=previous)
+    session_cache[uploaded_file.file_id] = record
+    if changed:
+        enqueue_document(record)
+    return record
@@ -0,0 +1,58 @@
+"""
+Document processing for visa applications: image screening and preprocessing,
+local image comparison, the passport / contract / declaration analysis pipelines
+and the background job queue.
+
+This is the stable API used by the portals and the analysis worker; import it once
+with the repository root on sys.path. Importing has no side effects and is cheap:
+each name is imported from its submodule on first access (PEP 562), so e.g. numpy
+and Pillow are only loaded when an image helper is used, and the Mistral client
+(and the .env file) only on the first `get_client()` call.
+"""
+
+import importlib
+
+# Public name -> submodule that defines it
+_EXPORTS = {
+    "get_client": ".scripts.mistral_client",
+    "assess_image_quality": ".scripts.image_quality",
+    "is_image_file": ".scripts.image_quality",
+    "get_preprocessed_image": ".scripts.image_preprocess",
+    "compare_images_locally": ".scripts.image_similarity",
+    "describe_local_comparison": ".scripts.image_similarity",
+    "normalize_date": ".scripts.date_normalization",
+    "format_date": ".scripts.date_normalization",
+    "get_image_pyramid": ".scripts.image_pyramid",
+    "pyramid_preview_path": ".scripts.image_pyramid",
+    "pyramid_region": ".scripts.image_pyramid",
+    "ANALYSIS_FIELDS": ".scripts.application_analysis",
+    "GROUND_TRUTH_PASSPORT": ".scripts.application_analysis",
+    "analyze_application": ".scripts.application_analysis",
+    "analyze_contract": ".scripts.application_analysis",
+    "analyze_declaration": ".scripts.application_analysis",
+    "analyze_passport": ".scripts.application_analysis",
+    "candidate_details": ".scripts.application_analysis",
+    "document_paths": ".scripts.application_analysis",
+}
+
+# Public submodules
+_MODULES = {
+    "job_queue": ".scripts.job_queue",
+}
+
+__all__ = [*_EXPORTS, *_MODULES]
+
+
+def __getattr__(name):
+    if name in _MODULES:
+        value = importlib.import_module(_MODULES[name], __name__)
+    elif name in _EXPORTS:
+        value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value  # Later lookups skip __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1 @@
+"""Document processing pipelines and their helpers. Import through `document_processor`."""
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Background worker that precomputes document analyses for submitted applications.
+The candidate portal queues an "analyze_application" job when an application is
+finished; this worker runs the passport, contract and declaration pipelines and
+stores the results in the application record, so the visa officer page opens
+without waiting for model calls.
+
+Usage (from the repository root):
+    python -m document_processor.scripts.analysis_worker          # run until interrupted
+    python -m document_processor.scripts.analysis_worker --once   # drain the queue and exit
+"""
+
+import os
+import sys
+import time
+import argparse
+
+from candidate.storage import app_dir, load_application, update_application
+from .mistral_client import get_client
+from .application_analysis import analyze_application
+from . import job_queue
+
+JOB_KIND = "analyze_application"
+POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "2.0"))  # Seconds between polls of an empty queue
+
+
+def process_job(job, client):
+    """Run the missing analyses for the application named in the job."""
+    appid = job["payload"]["appid"]
+    data = load_application(appid)
+    if data is None:
+        raise RuntimeError(f"No application record for {appid}")
+    changes = analyze_application(app_dir(appid), data, client,
+                                  save=lambda fields: update_application(appid, fields))
+    print(f"Application {appid}: stored {', '.join(changes) or 'nothing (already analyzed)'}")
+
+
+def run(once=False):
+    client = get_client()
+    if client is None:
+        sys.exit(1)
+
+    print(f"Analysis worker started (queue: {job_queue.QUEUE_FILE})")
+    while True:
+        job = job_queue.claim([JOB_KIND])
+        if job is None:
+            if once:
+                return
+            time.sleep(POLL_INTERVAL)
+            continue
+        try:
+            process_job(job, client)
+            job_queue.complete(job["id"])
+        except Exception as e:
+            print(f"Error processing job {job['id']} ({job['key']}, attempt {job['attempts']}): {e}")
+            job_queue.fail(job["id"], e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute document analyses for submitted applications.")
+    parser.add_argument("--once", action="store_true", help="Process the queued jobs and exit")
+    args = parser.parse_args()
+    try:
+        run(once=args.once)
+    except KeyboardInterrupt:
+        print("Analysis worker stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Document analysis pipelines for one application: passport, employment contract and
+employer declaration / Blue Card fit. Shared by the visa officer evaluation page
+(which runs them on demand) and the analysis worker (which runs them ahead of time
+when an application is submitted). Each pipeline returns the dict stored under its
+key in the application record.
+"""
+
+import os
+import json
+from pathlib import Path
+
+DOCUMENT_PROCESSOR_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GROUND_TRUTH_DIR = os.path.join(DOCUMENT_PROCESSOR_DIR, "ground_truth")
+GROUND_TRUTH_PASSPORT = os.path.join(GROUND_TRUTH_DIR, "indian_passport.png")
+GROUND_TRUTH_SIGNATURE = os.path.join(GROUND_TRUTH_DIR, "deepti-sign.png")
+
+# File names used when an application has no upload record for a document
+DEFAULT_DOCUMENT_FILES = {
+    "Passport": "indian_passport.png",
+    "WorkContract": "enhanced_employment_agreement.pdf",
+    "EmployerDeclaration": "deepti-erklaerung-zum-beschaeftigungsverhaeltnis_ba047549-signed.pdf",
+}
+
+# Define models
+EXTRACT_MODEL = "mistral-ocr-latest"              # Used for OCR of contracts and declarations
+SIGNATURE_COMPARE_MODEL = "pixtral-large-latest"  # Used for signature image comparison
+FINAL_ANALYSIS_MODEL = "mistral-large-latest"     # Used for final analysis and classification
+
+# Fixed until passport expiry and submission dates are captured per application
+PASSPORT_EXPIRY_DATE = "12.06.2024"
+SUBMISSION_DATE = "15.12.2022"
+
+ANALYSIS_FIELDS = ("passport_analysis", "contract_analysis", "declaration_analysis", "blue_card_analysis")
+
+
+def document_paths(app_folder, uploaded_documents=None):
+    """Return {"Passport": path, "WorkContract": path, "EmployerDeclaration": path} for an application."""
+    paths = {}
+    for key, filename in DEFAULT_DOCUMENT_FILES.items():
+        record = (uploaded_documents or {}).get(key)
+        path = record.get("path") if isinstance(record, dict) else record
+        paths[key] = path if path and os.path.exists(path) else os.path.join(app_folder, filename)
+    return paths
+
+
+def candidate_details(data):
+    """Return (name, address) of the candidate as entered in the application."""
+    personal_info = data.get("PersonalInformation", {})
+    name = f"{personal_info.get('FirstName', '')} {personal_info.get('Surname', '')}".strip()
+    return name, data.get("ResidenceData", {}).get("AddressOfResidenceInMunich", "")
+
+
+def analyze_passport(uploaded_path, client=None, ground_truth_path=GROUND_TRUTH_PASSPORT, write_stream=None):
+    """
+    Screen, extract, compare and classify an uploaded passport against the ground truth.
+    Unusable scans are classified "red" without any model call; otherwise `client`
+    (or the shared client) is used. If `write_stream` is given (a callable that consumes
+    a text generator and returns the full text, e.g. `st.write_stream`), the final
+    analysis is streamed through it. Returns the passport_analysis dict, or None on failure.
+    """
+    from .passport_comparison import (route_passport_comparison, analyze_comparisons,
+                                      stream_analyze_comparisons, classify_application)
+    from .mistral_client import get_client
+    from .image_quality import assess_image_quality
+    from .image_preprocess import get_preprocessed_image
+    from .image_similarity import compare_images_locally
+
+    # Screen the uploaded scan locally; hopeless scans are rejected without spending a vision model call
+    passport_quality = assess_image_quality(uploaded_path)
+    if not passport_quality["acceptable"]:
+        return {
+            "status": "red",
+            "feedback": "The uploaded passport scan is unusable: " + " ".join(passport_quality["issues"])
+                        + " Please ask the applicant to upload a clearer scan.",
+            "quality": passport_quality
+        }
+
+    client = client or get_client()
+    if client is None:
+        return None
+
+    # Steps 1-4: Extract and compare both passports, escalating to the large model only when needed
+    print("Extracting and comparing passports...")
+    routed = route_passport_comparison(ground_truth_path, uploaded_path, client, quality_score=passport_quality["score"])
+    if not routed:
+        return None
+    ground_truth_data, uploaded_data, json_comparison, image_comparison = routed
+
+    # Step 5: Provide final analysis (concise, max two sentences)
+    if write_stream:
+        final_analysis = write_stream(stream_analyze_comparisons(json_comparison, image_comparison, client, FINAL_ANALYSIS_MODEL))
+    else:
+        final_analysis = analyze_comparisons(json_comparison, image_comparison, client, FINAL_ANALYSIS_MODEL)
+
+    # Step 6: Classify the application
+    classification = classify_application(json_comparison, image_comparison, client, FINAL_ANALYSIS_MODEL)
+    if not classification:
+        return None
+
+    return {
+        "status": classification["classification"],
+        "feedback": final_analysis,
+        "quality": passport_quality,
+        # Memoized: already computed inside the routed image comparison
+        "local_similarity": compare_images_locally(
+            get_preprocessed_image(ground_truth_path),
+            get_preprocessed_image(uploaded_path)
+        )
+    }
+
+
+def analyze_contract(contract_path, candidate_name, candidate_address, client=None,
+                     signature_path=GROUND_TRUTH_SIGNATURE, write_stream=None):
+    """
+    Run the employment contract classification, streaming the signature comparison
+    through `write_stream` if given. Returns the contract_analysis dict, or None on failure.
+    """
+    from .mistral_client import get_client
+    from .contract_and_employer_declaration_processing import classify_contract
+
+    client = client or get_client()
+    if client is None:
+        return None
+    return classify_contract(
+        client=client,
+        employment_contract=Path(contract_path),
+        candidate_signature_path=signature_path,
+        candidate_name=candidate_name,
+        candidate_address=candidate_address,
+        passport_expiry_date=PASSPORT_EXPIRY_DATE,
+        submission_date=SUBMISSION_DATE,
+        EXTRACT_MODEL=EXTRACT_MODEL,
+        SIGNATURE_COMPARE_MODEL=SIGNATURE_COMPARE_MODEL,
+        FINAL_ANALYSIS_MODEL=FINAL_ANALYSIS_MODEL,
+        write_stream=write_stream
+    )
+
+
+def analyze_declaration(declaration_path, contract_path, client=None, write_stream=None):
+    """
+    Compare the employer declaration with the contract (locally) and evaluate the Blue
+    Card rules, streaming the model answer for the free-text criteria through `write_stream` if given.
+    Returns (declaration_analysis, blue_card_analysis) dicts, or None on failure.
+    """
+    from .mistral_client import get_client
+    from .contract_and_employer_declaration_processing import (
+        analyze_employer_declaration_and_blue_card_fit, StructuredOCRResponse, StructuredOCRResponseforContract
+    )
+    from .blue_card_rules import load_blue_card_rules
+
+    client = client or get_client()
+    if client is None:
+        return None
+    results = analyze_employer_declaration_and_blue_card_fit(
+        client=client,
+        employer_declaration=Path(declaration_path),
+        employment_contract=Path(contract_path),
+        blue_card_rules=load_blue_card_rules(),
+        EXTRACT_MODEL=EXTRACT_MODEL,
+        FINAL_ANALYSIS_MODEL=FINAL_ANALYSIS_MODEL,
+        StructuredOCRResponse=StructuredOCRResponse,
+        StructuredOCRResponseforContract=StructuredOCRResponseforContract,
+        write_stream=write_stream
+    )
+    if results is None:
+        return None
+    declaration_accuracy, blue_card_fit = results
+    return json.loads(declaration_accuracy), json.loads(blue_card_fit)
+
+
+def analyze_application(app_folder, data, client=None, save=None):
+    """
+    Run every analysis that is missing from the application record `data`.
+    Each result is passed to `save` (a callable taking a dict of fields) as soon as
+    it is ready, so a later failure does not lose earlier work.
+    Returns a dict of all new fields; raises RuntimeError if a pipeline fails.
+    """
+    paths = document_paths(app_folder, data.get("LivelihoodInformation", {}).get("UploadedDocuments"))
+    changes = {}
+
+    def record(fields):
+        changes.update(fields)
+        if save:
+            save(fields)
+
+    if "passport_analysis" not in data:
+        passport_analysis = analyze_passport(paths["Passport"], client)
+        if passport_analysis is None:
+            raise RuntimeError("Passport analysis failed")
+        record({"passport_analysis": passport_analysis})
+
+    if "contract_analysis" not in data:
+        candidate_name, candidate_address = candidate_details(data)
+        contract_analysis = analyze_contract(paths["WorkContract"], candidate_name, candidate_address, client)
+        if contract_analysis is None:
+            raise RuntimeError("Contract analysis failed")
+        record({"contract_analysis": contract_analysis})
+
+    if "declaration_analysis" not in data or "blue_card_analysis" not in data:
+        declaration_results = analyze_declaration(paths["EmployerDeclaration"], paths["WorkContract"], client)
+        if declaration_results is None:
+            raise RuntimeError("Declaration analysis failed")
+        record({"declaration_analysis": declaration_results[0], "blue_card_analysis": declaration_results[1]})
+
+    return changes
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Blue Card eligibility as a declarative, versioned rule set (prompts/blue_card_rules.json,
+written from prompts/blue_card_criteria.txt). Numeric and boolean criteria — salary
+thresholds, a degree obtained in Germany, the period of employment — are decided
+locally from the `StructuredOCRResponse` fields of the employer declaration. Only the
+free-text criteria the rules cannot decide are put to the model, in a single call.
+
+Each result stores the declaration fields and the per-rule outcomes, so after a rule
+change (e.g. a new salary threshold) every stored analysis can be re-evaluated locally;
+model answers are reused as long as their question is unchanged.
+
+Usage (from the repository root):
+    python -m document_processor.scripts.blue_card_rules   # re-evaluate analyses made with older rules
+"""
+
+import os
+import re
+import sys
+import json
+import argparse
+
+from .field_comparison import normalize_duration, normalize_flag, normalize_text, parse_amount
+from .mistral_client import get_client, stream_chat_text
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "prompts", "blue_card_rules.json")
+ANALYSIS_MODEL = "mistral-large-latest"
+
+OUTCOMES = ("pass", "clarify", "fail")
+ANNUAL_SALARY_PATTERN = re.compile(r"\b(year|years|yearly|annual|annually|jahr|jaehrlich|p a)\b")
+
+_rules_cache = {}
+
+
+def load_blue_card_rules(path=RULES_PATH):
+    """Return the rule set in `path`, read again only when the file changes."""
+    mtime = os.stat(path).st_mtime_ns
+    if _rules_cache.get(path, (None,))[0] != mtime:
+        with open(path, "r", encoding="utf-8") as f:
+            _rules_cache[path] = (mtime, json.load(f))
+    return _rules_cache[path][1]
+
+
+def annual_salary(value, months_per_year):
+    """Gross annual salary from the declared salary (monthly unless stated as annual), or None."""
+    amount = parse_amount(value)
+    if amount is None:
+        return None
+    return amount if ANNUAL_SALARY_PATTERN.search(normalize_text(value)) else amount * months_per_year
+
+
+def check_flag(rule, fields):
+    if normalize_flag(fields.get(rule["field"], "")) is True:
+        return "pass", rule["pass"]
+    if rule.get("otherwise") == "model":
+        return "model", rule["question"]
+    return "fail", rule["fail"]
+
+
+def check_min_duration_months(rule, fields):
+    duration = normalize_duration(fields.get(rule["field"], ""))
+    if duration == "unlimited" or (isinstance(duration, float) and duration >= rule["minimum"]):
+        return "pass", rule["pass"]
+    if isinstance(duration, float):
+        return "fail", rule["fail"]
+    return "model", rule["question"]
+
+
+def check_min_annual_salary(rule, fields):
+    salary = annual_salary(fields.get(rule["field"], ""), rule["months_per_year"])
+    if salary is None:
+        return "clarify", f"The salary could not be read from the declaration: '{fields.get(rule['field'], '')}'."
+    values = {"salary": salary, "minimum": rule["minimum"], "reduced_minimum": rule["reduced_minimum"],
+              "bottleneck_professions": "; ".join(rule["bottleneck_professions"])}
+    if salary >= rule["minimum"]:
+        return "pass", rule["pass"].format(**values)
+    if salary < rule["reduced_minimum"]:
+        return "fail", rule["fail"].format(**values)
+    return "model", rule["question"].format(**values)
+
+
+def check_model(rule, fields):
+    return "model", rule["question"]
+
+
+RULE_CHECKS = {
+    "flag": check_flag,
+    "min_duration_months": check_min_duration_months,
+    "min_annual_salary": check_min_annual_salary,
+    "model": check_model,
+}
+
+
+def evaluate_rules_locally(fields, rules, previous=None):
+    """
+    Apply every rule to the declaration `fields`. Returns (results, questions):
+    results maps rule id -> {"outcome", "explanation", "decided_by"}, and questions maps
+    the ids of the rules left to the model to their question. Model answers stored in
+    `previous` (an earlier result) are reused when the question has not changed.
+    """
+    previous_results = (previous or {}).get("rules", {})
+    results, questions = {}, {}
+    for rule in rules["rules"]:
+        outcome, text = RULE_CHECKS[rule["type"]](rule, fields)
+        if outcome != "model":
+            results[rule["id"]] = {"outcome": outcome, "explanation": text, "decided_by": "rules"}
+        elif previous_results.get(rule["id"], {}).get("question") == text:
+            results[rule["id"]] = previous_results[rule["id"]]
+        else:
+            questions[rule["id"]] = text
+    return results, questions
+
+
+def model_question_messages(fields, rules, questions):
+    """Prompt for the criteria the rules cannot decide, with only the declaration fields they need."""
+    needed = set()
+    for rule in rules["rules"]:
+        if rule["id"] in questions:
+            needed.update(rule.get("fields", []))
+            if "field" in rule:
+                needed.add(rule["field"])
+    details = {name: value for name, value in fields.items() if name in needed}
+    prompt_text = (
+        "You are checking a candidate's EU Blue Card eligibility based on the employer declaration details. "
+        "Answer each question below. The final output must be a JSON object with the question ids as keys; each value "
+        "is an object with 'outcome' ('pass', 'clarify' or 'fail') and a one-sentence 'explanation'. "
+        "Only output the JSON and Nothing else.\n\n"
+        "Declaration Details:\n" + json.dumps(details, ensure_ascii=False) + "\n\n"
+        "Questions:\n" + "\n".join(f"- {rule_id}: {question}" for rule_id, question in questions.items())
+    )
+    return [
+        {
+            "role": "user",
+            "content": [{"type": "text", "text": prompt_text}]
+        }
+    ]
+
+
+def parse_model_answers(content, questions):
+    """Turn the model's JSON answer into rule results; unusable answers become "clarify"."""
+    try:
+        answers = json.loads(content)
+    except Exception:
+        answers = {}
+    results = {}
+    for rule_id, question in questions.items():
+        answer = answers.get(rule_id) if isinstance(answers, dict) else None
+        if isinstance(answer, dict) and answer.get("outcome") in OUTCOMES:
+            outcome, explanation = answer["outcome"], str(answer.get("explanation", ""))
+        else:
+            outcome, explanation = "clarify", "This criterion could not be decided automatically; please review it."
+        results[rule_id] = {"outcome": outcome, "explanation": explanation, "decided_by": "model", "question": question}
+    return results
+
+
+def blue_card_result(fields, rules, results):
+    """Combine the rule results into the stored analysis: explanation, classification and the data for re-evaluation."""
+    outcomes = [result["outcome"] for result in results.values()]
+    if "fail" in outcomes:
+        classification = "red"
+    elif "clarify" in outcomes:
+        classification = "yellow"
+    else:
+        classification = "green"
+    return {
+        "explanation": {rule_id: result["explanation"] for rule_id, result in results.items()},
+        "classification": classification,
+        "rules_version": rules["version"],
+        "rules": results,
+        "fields": fields,
+    }
+
+
+def evaluate_blue_card_fit(fields, rules, client=None, model=ANALYSIS_MODEL, previous=None, write_stream=None):
+    """
+    Evaluate the declaration `fields` against `rules`. The model is called only for the
+    rules left undecided, and not at all if a rule already fails (the candidate is
+    ineligible either way). If `write_stream` is given (a callable that consumes a text
+    generator and returns the full text, e.g. `st.write_stream`), the model answer is
+    streamed through it. Returns the blue_card_analysis dict.
+    """
+    results, questions = evaluate_rules_locally(fields, rules, previous)
+    if questions and any(result["outcome"] == "fail" for result in results.values()):
+        for rule_id in questions:
+            results[rule_id] = {"outcome": "skipped", "decided_by": "rules",
+                                "explanation": "Not evaluated: another mandatory criterion is not met."}
+    elif questions:
+        client = client or get_client()
+        try:
+            if client is None:
+                raise RuntimeError("no Mistral client available")
+            messages = model_question_messages(fields, rules, questions)
+            if write_stream:
+                content = write_stream(stream_chat_text(client, model=model, messages=messages, temperature=0.0,
+                                                        response_format={"type": "json_object"}))
+            else:
+                response = client.chat.complete(model=model, messages=messages, temperature=0.0,
+                                                response_format={"type": "json_object"})
+                content = response.choices[0].message.content
+        except Exception as e:
+            print(f"Error during Blue Card criteria analysis: {e}")
+            content = ""
+        results.update(parse_model_answers(content, questions))
+
+    # Report in rule set order
+    ordered = {rule["id"]: results[rule["id"]] for rule in rules["rules"]}
+    return blue_card_result(fields, rules, ordered)
+
+
+def reevaluate_stored_analyses(data_root=None):
+    """
+    Re-evaluate every stored Blue Card analysis made with an older rule set version.
+    Returns (re-evaluated, skipped) counts; analyses without stored fields are skipped.
+    """
+    from candidate.storage import DATA_ROOT, iter_application_dirs, read_application_file, update_application_file
+
+    rules = load_blue_card_rules()
+    reevaluated = skipped = 0
+    for appid, folder in iter_application_dirs(data_root or DATA_ROOT):
+        data = read_application_file(folder, fields=("blue_card_analysis",)) or {}
+        previous = data.get("blue_card_analysis")
+        if not isinstance(previous, dict) or previous.get("rules_version") == rules["version"]:
+            continue
+        if "fields" not in previous:
+            skipped += 1
+            continue
+        analysis = evaluate_blue_card_fit(previous["fields"], rules, previous=previous)
+        update_application_file(folder, {"blue_card_analysis": analysis})
+        print(f"Application {appid}: {previous.get('classification')} -> {analysis['classification']}")
+        reevaluated += 1
+    return reevaluated, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-evaluate stored Blue Card analyses against the current rule set.")
+    parser.add_argument("data_root", nargs="?", default=None, help="Application data directory (default: candidate/data)")
+    args = parser.parse_args()
+
+    if args.data_root and not os.path.isdir(args.data_root):
+        print(f"Error: Data directory not found: {args.data_root}")
+        sys.exit(1)
+    reevaluated, skipped = reevaluate_stored_analyses(args.data_root)
+    print(f"Re-evaluated {reevaluated} analysis(es) with rules version {load_blue_card_rules()['version']}; "
+          f"{skipped} without stored declaration fields skipped")
+
+
+if __name__ == "__main__":
+    main()
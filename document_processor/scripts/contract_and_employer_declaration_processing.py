@@ -5,14 +5,15 @@ import json
 import base64
 import re
 from pathlib import Path
-from datetime import datetime
 from pydantic import BaseModel
-from dotenv import load_dotenv
-from mistralai import Mistral, TextChunk, ImageURLChunk, DocumentURLChunk
+from mistralai import TextChunk, ImageURLChunk, DocumentURLChunk
 from mistralai.models import OCRResponse
-
-# Load environment variables from .env file
-load_dotenv()
+from .mistral_client import get_client, stream_chat_text
+from .image_preprocess import get_preprocessed_image
+from .image_similarity import compare_images_locally, describe_local_comparison
+from .field_comparison import compare_declaration_with_contract
+from .date_normalization import format_date, normalize_date
+from .blue_card_rules import evaluate_blue_card_fit, load_blue_card_rules
 
 class StructuredOCRResponse(BaseModel):
     employee_name: str
@@ -124,6 +125,52 @@ def extract_employee_signature(markdown_str: str, signature_alt: str = "img-1.jp
     return None
 
 
+# The whole data URI up to the closing parenthesis: Mistral OCR's image_base64 already carries a
+# "data:image/jpeg;base64," prefix, so get_combined_markdown emits it twice
+INLINE_IMAGE_PATTERN = re.compile(r"!\[([^\]]*)\]\(data:image/[^)]*\)")
+CHARS_PER_TOKEN = 4  # Rough average for English/German prose; base64 tokenizes even worse
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap estimate of the number of prompt tokens in a text (no tokenizer needed)."""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def strip_inline_images(markdown_str: str) -> str:
+    """
+    Return a text-only projection of the OCR markdown: every inline base64 image is
+    replaced by a short placeholder such as "[image: img-1.jpeg]". The full markdown
+    (with the images, e.g. for signature extraction) is left untouched.
+    """
+    return INLINE_IMAGE_PATTERN.sub(lambda match: f"[image: {match.group(1)}]", markdown_str)
+
+
+def text_only_markdown(markdown_str: str, label: str) -> str:
+    """Strip inline images from OCR markdown and report the estimated prompt size before/after."""
+    text_only = strip_inline_images(markdown_str)
+    if "data:image/" in text_only:
+        print(f"{label}: warning, inline image data left in the text-only markdown")
+    print(f"{label}: ~{estimate_tokens(markdown_str)} tokens with images, ~{estimate_tokens(text_only)} tokens text-only")
+    return text_only
+
+
+def signature_comparison_messages(signature_base64_markdown: str, signature_base64_ground: str):
+    """Prompt for the signature comparison, shared by the blocking and streaming variants."""
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": (
+                    "You are a visa officer reviewing candidate signatures. Compare the candidate signature extracted "
+                    "from the contract markdown with the ground-truth signature provided separately. Determine whether "
+                    "the two signatures match or if there are any discrepancies. Provide a concise summary of your findings."
+                )},
+                {"type": "image_url", "image_url": f"data:image/jpeg;base64,{signature_base64_markdown}"},
+                {"type": "image_url", "image_url": f"data:image/jpeg;base64,{signature_base64_ground}"}
+            ]
+        }
+    ]
+
 def compare_signatures(signature_base64_markdown: str, signature_base64_ground: str, client, model):
     """
     Use the LLM to compare two candidate signature images.
@@ -137,30 +184,21 @@ def compare_signatures(signature_base64_markdown: str, signature_base64_ground:
         model: The model to use for comparison (e.g., "pixtral-large-latest").
     
     Returns:
-        A string response from the LLM detailing whether the signatures match.
+        A string response (from the LLM, or from the local pre-comparison for
+        identical images and clear mismatches) detailing whether the signatures match.
     """
     if not signature_base64_markdown or not signature_base64_ground:
         return "Error: One or both signature images are missing."
     
-    messages = [
-        {
-            "role": "user",
-            "content": [
-                {"type": "text", "text": (
-                    "You are a visa officer reviewing candidate signatures. Compare the candidate signature extracted "
-                    "from the contract markdown with the ground-truth signature provided separately. Determine whether "
-                    "the two signatures match or if there are any discrepancies. Provide a concise summary of your findings."
-                )},
-                {"type": "image_url", "image_url": f"data:image/jpeg;base64,{signature_base64_markdown}"},
-                {"type": "image_url", "image_url": f"data:image/jpeg;base64,{signature_base64_ground}"}
-            ]
-        }
-    ]
+    # Identical images and clear mismatches are decided locally without a model call
+    local = compare_images_locally(signature_base64_markdown, signature_base64_ground)
+    if local["decision"] != "ambiguous":
+        return describe_local_comparison(local, subject="signatures")
     
     try:
         response = client.chat.complete(
             model=model,
-            messages=messages,
+            messages=signature_comparison_messages(signature_base64_markdown, signature_base64_ground),
             temperature=0.0,
             response_format={"type": "text"}
         )
@@ -168,6 +206,32 @@ def compare_signatures(signature_base64_markdown: str, signature_base64_ground:
     except Exception as e:
         return f"Error during signature comparison: {e}"
 
+def stream_compare_signatures(signature_base64_markdown: str, signature_base64_ground: str, client, model):
+    """
+    Streaming variant of `compare_signatures`: yields the comparison text as it is
+    generated (local decisions and errors are yielded whole). Closing the generator
+    cancels the request.
+    """
+    if not signature_base64_markdown or not signature_base64_ground:
+        yield "Error: One or both signature images are missing."
+        return
+    
+    local = compare_images_locally(signature_base64_markdown, signature_base64_ground)
+    if local["decision"] != "ambiguous":
+        yield describe_local_comparison(local, subject="signatures")
+        return
+    
+    try:
+        yield from stream_chat_text(
+            client,
+            model=model,
+            messages=signature_comparison_messages(signature_base64_markdown, signature_base64_ground),
+            temperature=0.0,
+            response_format={"type": "text"}
+        )
+    except Exception as e:
+        yield f"Error during signature comparison: {e}"
+
 
 def check_employee_info(extracted_json: dict, ground_truth_name: str, ground_truth_address: str) -> str:
     """
@@ -211,21 +275,24 @@ def check_employment_start_date(employment_start_date_str: str, passport_expiry_
     Check whether the employment start date is after the application submission date 
     but before the passport expiry date.
     
-    Dates should be in the format "dd.mm.yyyy".
+    Dates may be in any format recognized by `normalize_date` ("dd.mm.yyyy", ISO,
+    "1. März 2023", ...).
     
     Returns:
         A JSON string with two keys:
           - "employment_start_date_valid": a boolean
           - "explanation": a short explanation.
     """
-    try:
-        employment_start = datetime.strptime(employment_start_date_str, "%d.%m.%Y")
-        passport_expiry = datetime.strptime(passport_expiry_date_str, "%d.%m.%Y")
-        submission_date = datetime.strptime(submission_date_str, "%d.%m.%Y")
-    except Exception as e:
+    employment_start = normalize_date(employment_start_date_str)
+    passport_expiry = normalize_date(passport_expiry_date_str)
+    submission_date = normalize_date(submission_date_str)
+    unparsed = [value for value, parsed in ((employment_start_date_str, employment_start),
+                                            (passport_expiry_date_str, passport_expiry),
+                                            (submission_date_str, submission_date)) if parsed is None]
+    if unparsed:
         return json.dumps({
             "employment_start_date_valid": False,
-            "explanation": f"Error parsing dates: {e}"
+            "explanation": f"Error parsing dates: {', '.join(repr(value) for value in unparsed)} not recognized"
         })
     
     if submission_date < employment_start < passport_expiry:
@@ -295,15 +362,16 @@ def classify_contract_status(employee_info_comparison, employment_date_compariso
 
 def generate_markdown_from_ocr(client, file_under_processing, extract_model):
     """
-    Uploads and processes the employment contract PDF using OCR and returns the combined markdown.
+    Uploads and processes a document PDF using OCR and returns the combined markdown.
     
     Args:
         client: The Mistral client instance.
-        employment_contract: A Path object representing the employment contract PDF.
+        file_under_processing: A Path object representing the PDF.
         extract_model: The model to use for OCR extraction (e.g., "mistral-ocr-latest").
     
     Returns:
-        str: The combined markdown generated from the OCR response.
+        str: The combined markdown generated from the OCR response, or None if the
+        upload or the OCR failed.
     """
     try:
         uploaded_file = client.files.upload(
@@ -314,84 +382,42 @@ def generate_markdown_from_ocr(client, file_under_processing, extract_model):
             purpose="ocr",
         )
     except Exception as e:
-        print(f"Error uploading file: {e}")
-        sys.exit(1)
+        print(f"Error uploading file {file_under_processing}: {e}")
+        return None
 
-    signed_url = client.files.get_signed_url(file_id=uploaded_file.id, expiry=1)
-    pdf_response = client.ocr.process(
-        document=DocumentURLChunk(document_url=signed_url.url),
-        model=extract_model,
-        include_image_base64=True
-    )
+    try:
+        signed_url = client.files.get_signed_url(file_id=uploaded_file.id, expiry=1)
+        pdf_response = client.ocr.process(
+            document=DocumentURLChunk(document_url=signed_url.url),
+            model=extract_model,
+            include_image_base64=True
+        )
+    except Exception as e:
+        print(f"Error during OCR of {file_under_processing}: {e}")
+        return None
     # Process OCR response into combined markdown
     combined_markdown = get_combined_markdown(pdf_response)
     return combined_markdown
 
-def analyze_declaration_accuracy(declaration_details, contract_details, client, model):
+def analyze_declaration_accuracy(declaration_details, contract_details):
     """
-    Combine the JSON and image comparisons to provide a final analysis.
-    Returns the LLM's analysis as a concise response (maximum two sentences)
-    that also recommends asking the applicant for clarifications if needed.
+    Compare the employer declaration details with the contract details (both dicts of
+    `StructuredOCRResponseforContract` fields) locally, without a model call.
+    Returns the comparison as a JSON string with similarities, differences and a
+    green/yellow/red classification.
     """
-    prompt_text = (
-        "Based on the following details, highlight similarities and differences between employer contract details and declaration details for the fields present in the contract details. "
-        "The final output must be a JSON, with similarities, differences, and classification as keys. The classification is green if all fields match perfectly, yellow if up to 20 percent of the fields don't match, and red otherwise. Please take care of any unicodes and abbreviations (such as Straße to Str.) in the descriptions and standardize the dates to DD.MM.YYYY format before comparing. Please do not include additional_fields_in_declaration for your analysis of classification category. Only output the JSON and Nothing else.\n\n"
-        "Declaration Details:\n" + declaration_details + "\n\n"
-        "Contract Details:\n" + contract_details
-    )
-    
-    messages = [
-        {
-            "role": "user",
-            "content": [{"type": "text", "text": prompt_text}]
-        }
-    ]
-    
-    try:
-        response = client.chat.complete(
-            model=model,
-            messages=messages,
-            temperature=0.0,
-            response_format={"type": "json_object"}
-        )
-        post_processed_response = json.loads(response.choices[0].message.content)
-
-        return json.dumps(post_processed_response, indent=4)
-    except Exception as e:
-        return f"Error during analysis: {e}"
+    return json.dumps(compare_declaration_with_contract(declaration_details, contract_details), indent=4)
 
-def analyze_blue_card_fit(declaration_details, blue_card_criteria, client, model):
+def analyze_blue_card_fit(declaration_details, blue_card_rules, client, model, write_stream=None):
     """
-    Combine the JSON and image comparisons to provide a final analysis.
-    Returns the LLM's analysis as a concise response (maximum two sentences)
-    that also recommends asking the applicant for clarifications if needed.
+    Evaluate the employer declaration details (a dict of `StructuredOCRResponse` fields)
+    against the Blue Card rule set. Numeric and boolean criteria are decided locally; the
+    model is asked only about the free-text criteria the rules cannot decide (streamed
+    through `write_stream` if given). Returns the evaluation as a JSON string with an
+    explanation per criterion and a green/yellow/red classification.
     """
-    prompt_text = (
-        "Based on the employer declaration details and the blue card criteria, think step-by-step, and analyze the likelihood of the candidate successfully getting a blue card."
-        "The final output must be a JSON, with explanation, and classification as keys. The classification is green if the candidate fits the criteria completely, yellow if some things need clarification, and red if a major condition is violated. Only output the JSON and Nothing else.\n\n"
-        "Declaration Details:\n" + declaration_details + "\n\n"
-        "Contract Details:\n" + blue_card_criteria
-    )
-    
-    messages = [
-        {
-            "role": "user",
-            "content": [{"type": "text", "text": prompt_text}]
-        }
-    ]
-    
-    try:
-        response = client.chat.complete(
-            model=model,
-            messages=messages,
-            temperature=0.0,
-            response_format={"type": "json_object"}
-        )
-        post_processed_response = json.loads(response.choices[0].message.content)
-
-        return json.dumps(post_processed_response, indent=4)
-    except Exception as e:
-        return f"Error during analysis: {e}"
+    return json.dumps(evaluate_blue_card_fit(declaration_details, blue_card_rules, client, model,
+                                             write_stream=write_stream), indent=4, ensure_ascii=False)
 
 def classify_contract(
     client,
@@ -403,34 +429,49 @@ def classify_contract(
     submission_date,
     EXTRACT_MODEL,
     SIGNATURE_COMPARE_MODEL,
-    FINAL_ANALYSIS_MODEL
+    FINAL_ANALYSIS_MODEL,
+    write_stream=None
 ):
     """
     Generates a markdown representation of the employment contract via OCR,
     extracts and compares signatures, parses structured JSON from the OCR output,
     checks employee info and employment start date, and finally classifies the contract.
+    If `write_stream` is given (a callable that consumes a text generator and returns
+    the full text, e.g. `st.write_stream`), the signature comparison is streamed through it.
     
     Returns:
-        dict: A JSON object with classification details (e.g., {"classification": "...", "summary": "..."})
+        dict: A JSON object with classification details (e.g., {"classification": "...", "summary": "..."}),
+        or None if the OCR or the classification failed.
     """
-    # Generate markdown from OCR (assumes generate_markdown_from_ocr is defined elsewhere)
+    # Generate markdown from OCR
     contract_markdown = generate_markdown_from_ocr(client, employment_contract, EXTRACT_MODEL)
+    if contract_markdown is None:
+        return None
     
     # Extract employee signature from the combined markdown
     extracted_signature_base64 = extract_employee_signature(contract_markdown, signature_alt="img-1.jpeg")
     
-    # Read candidate's ground-truth signature from file
-    candidate_signature_base64 = encode_image(candidate_signature_path)
+    # Read candidate's ground-truth signature from file (cropped and normalized, without deskewing)
+    candidate_signature_base64 = encode_image(get_preprocessed_image(candidate_signature_path, deskew=False))
     
     # Compare the extracted signature with the candidate's signature
-    signature_comparison = compare_signatures(
-        extracted_signature_base64,
-        candidate_signature_base64,
-        client,
-        SIGNATURE_COMPARE_MODEL
-    )
+    if write_stream:
+        signature_comparison = write_stream(stream_compare_signatures(
+            extracted_signature_base64,
+            candidate_signature_base64,
+            client,
+            SIGNATURE_COMPARE_MODEL
+        ))
+    else:
+        signature_comparison = compare_signatures(
+            extracted_signature_base64,
+            candidate_signature_base64,
+            client,
+            SIGNATURE_COMPARE_MODEL
+        )
     
-    # Extract structured JSON from OCR markdown using chat completion
+    # Extract structured JSON from the text-only OCR markdown (the images are not needed for this)
+    contract_text = text_only_markdown(contract_markdown, "Contract extraction prompt")
     chat_response = client.chat.complete(
         model="pixtral-large-latest",
         messages=[
@@ -439,7 +480,7 @@ def classify_contract(
                 "content": [
                     TextChunk(
                         text=(
-                            f"This is employment contract's OCR in markdown:\n\n{contract_markdown}\n.\n"
+                            f"This is employment contract's OCR in markdown:\n\n{contract_text}\n.\n"
                             "Convert this into a sensible structured json response, with the keys 'employee_name', 'employee_address', 'employee_salary', 'employment_start_date', 'employee_signature_present' and 'employer_signature_present'. "
                             "The date should be in the format DD.MM.YYYY. "
                             "The output should be strictly be json with no extra commentary."
@@ -456,8 +497,9 @@ def classify_contract(
     # Check employee info
     employee_info_comparison = check_employee_info(structured_response, candidate_name, candidate_address)
     
-    # Check employment start date validity
+    # Check employment start date validity (rewritten as DD.MM.YYYY if the model used another format)
     employment_start_date = structured_response.get("employment_start_date", "").strip()
+    employment_start_date = format_date(employment_start_date) or employment_start_date
     employment_date_comparison = check_employment_start_date(employment_start_date, passport_expiry_date, submission_date)
     
     # Classify contract status based on the comparisons
@@ -469,17 +511,22 @@ def classify_contract(
         FINAL_ANALYSIS_MODEL
     )
     
+    # Attach the local signature similarity score for the visa officer
+    if classification_result is not None and extracted_signature_base64 and candidate_signature_base64:
+        classification_result["signature_similarity"] = compare_images_locally(extracted_signature_base64, candidate_signature_base64)
+    
     return classification_result
 
 def analyze_employer_declaration_and_blue_card_fit(
     client,
     employer_declaration,
     employment_contract,
-    blue_card_criteria,
+    blue_card_rules,
     EXTRACT_MODEL,
     FINAL_ANALYSIS_MODEL,
     StructuredOCRResponse,
-    StructuredOCRResponseforContract
+    StructuredOCRResponseforContract,
+    write_stream=None
 ):
     """
     Processes the employer declaration and employment contract via OCR,
@@ -495,22 +542,33 @@ def analyze_employer_declaration_and_blue_card_fit(
         client: The Mistral client instance.
         employer_declaration: A Path object for the employer declaration PDF.
         employment_contract: A Path object for the employment contract PDF.
-        blue_card_criteria: Criteria (string) for evaluating the Blue Card Fit.
+        blue_card_rules: The Blue Card rule set (see `load_blue_card_rules`).
         EXTRACT_MODEL: The OCR extraction model to use.
         FINAL_ANALYSIS_MODEL: The model used for final analysis.
         StructuredOCRResponse: The response format class for the full employer declaration.
         StructuredOCRResponseforContract: The response format class for partial extraction (for contract comparison).
+        write_stream: Optional callable that consumes a text generator and returns the full text
+            (e.g. `st.write_stream`); the model part of the Blue Card Fit analysis is then streamed through it.
     
     Returns:
         tuple: A tuple containing:
             - declaration_accuracy (str): The analysis result comparing the employer declaration with the employment contract.
             - blue_card_fit (str): The Blue Card Fit evaluation result.
+        or None if the OCR of either document failed.
     """
     # Generate OCR markdown for the employment contract
     contract_markdown = generate_markdown_from_ocr(client, employment_contract, EXTRACT_MODEL)
+    if contract_markdown is None:
+        return None
     
     # Generate OCR markdown for the employer declaration
     employer_declaration_markdown = generate_markdown_from_ocr(client, employer_declaration, EXTRACT_MODEL)
+    if employer_declaration_markdown is None:
+        return None
+    
+    # The structured extractions only need the text, so drop the inline page images from the prompts
+    employer_declaration_text = text_only_markdown(employer_declaration_markdown, "Employer declaration extraction prompt")
+    contract_text = text_only_markdown(contract_markdown, "Contract extraction prompt")
     
     # Extract detailed structured JSON from the employer declaration OCR markdown
     chat_response_full = client.chat.parse(
@@ -521,7 +579,7 @@ def analyze_employer_declaration_and_blue_card_fit(
                 "content": [
                     TextChunk(
                         text=(
-                            f"This is the employer declaration's OCR in markdown:\n{employer_declaration_markdown}\n.\n"
+                            f"This is the employer declaration's OCR in markdown:\n{employer_declaration_text}\n.\n"
                             "Convert this into a structured JSON response with the OCR contents in a sensible dictionnary."
                         )
                     )
@@ -542,7 +600,7 @@ def analyze_employer_declaration_and_blue_card_fit(
                 "content": [
                     TextChunk(
                         text=(
-                            f"This is the employer declaration's OCR in markdown:\n{employer_declaration_markdown}\n.\n"
+                            f"This is the employer declaration's OCR in markdown:\n{employer_declaration_text}\n.\n"
                             "Convert this into a structured JSON response with the OCR contents in a sensible dictionnary."
                         )
                     )
@@ -563,7 +621,7 @@ def analyze_employer_declaration_and_blue_card_fit(
                 "content": [
                     TextChunk(
                         text=(
-                            f"This is the employment contract's OCR in markdown:\n{contract_markdown}\n.\n"
+                            f"This is the employment contract's OCR in markdown:\n{contract_text}\n.\n"
                             "Convert this into a structured JSON response with the OCR contents in a sensible dictionnary."
                         )
                     )
@@ -575,20 +633,19 @@ def analyze_employer_declaration_and_blue_card_fit(
     )
     contract_structured_response = dict(chat_response_contract.choices[0].message.parsed)
     
-    # Analyze the comparison between the partial employer declaration and the employment contract
+    # Compare the partial employer declaration with the employment contract (locally, no model call)
     declaration_accuracy = analyze_declaration_accuracy(
-        str(partial_employer_declaration_structured_response),
-        str(contract_structured_response),
-        client,
-        FINAL_ANALYSIS_MODEL
+        partial_employer_declaration_structured_response,
+        contract_structured_response
     )
     
     # Evaluate Blue Card Fit using the detailed employer declaration structured response
     blue_card_fit = analyze_blue_card_fit(
-        str(total_employer_declaration_structured_response),
-        blue_card_criteria,
+        total_employer_declaration_structured_response,
+        blue_card_rules,
         client,
-        FINAL_ANALYSIS_MODEL
+        FINAL_ANALYSIS_MODEL,
+        write_stream=write_stream
     )
     
     return declaration_accuracy, blue_card_fit
@@ -601,19 +658,16 @@ def main():
     candidate_address = 'Theresienstr. 999, 80333 Munich, Bayern'
     passport_expiry_date = '12.06.2024'
     submission_date = '15.12.2022'
-    blue_card_criteria_path = '/Users/q654642/Desktop/resAIde/resAIde/document_processor/prompts/blue_card_criteria.txt'
-    blue_card_criteria = read_txt_file(blue_card_criteria_path)
+    blue_card_rules = load_blue_card_rules()
     
     employment_contract_path = '/Users/q654642/Desktop/resAIde/resAIde/document_processor/deepti-singhal-documents/enhanced_employment_agreement (1).pdf'
     employment_contract = Path(employment_contract_path)
     candidate_signature_path = '/Users/q654642/Desktop/resAIde/resAIde/document_processor/ground_truth/deepti-sign.png'
     
-    # Initialize the Mistral client
-    MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
-    if not MISTRAL_API_KEY:
-        print("Error: MISTRAL_API_KEY is not set in the .env file.")
+    # Initialize the shared Mistral client
+    client = get_client()
+    if client is None:
         sys.exit(1)
-    client = Mistral(api_key=MISTRAL_API_KEY)
     
     # Define models
     EXTRACT_MODEL = "mistral-ocr-latest"            # Used for JSON extraction
@@ -644,7 +698,7 @@ def main():
         client=client,
         employer_declaration=employer_declaration,
         employment_contract=employment_contract,
-        blue_card_criteria=blue_card_criteria,
+        blue_card_rules=blue_card_rules,
         EXTRACT_MODEL=EXTRACT_MODEL,
         FINAL_ANALYSIS_MODEL=FINAL_ANALYSIS_MODEL,
         StructuredOCRResponse=StructuredOCRResponse,
@@ -0,0 +1,120 @@
+"""
+Date normalization shared by the comparison functions. Extracted documents write
+dates in many ways — "01.03.2023", "2023-03-01", "1. März 2023", "12 JUN /JUIN 2024" —
+and every check compares them as `datetime.date` values instead of asking a model to
+reconcile the formats. Bare digit strings are never read as dates (a passport or
+document number could look like one); the YYMMDD fields of a passport's machine-readable
+zone are read only through `parse_mrz_date`, by callers that know the field.
+
+The candidate formats are pre-compiled regular expressions (numeric dates are read
+day first, as on German and Indian documents) and results are memoized, so repeated
+values across a batch evaluation cost a dictionary lookup.
+"""
+
+import re
+from datetime import date
+from functools import lru_cache
+
+STANDARD_FORMAT = "%d.%m.%Y"
+
+# Two-digit years at or below this value are read as 20YY, the others as 19YY. Birth
+# dates pivot on the current year instead, so they are never in the future.
+CENTURY_PIVOT = (date.today().year + 20) % 100
+
+# English, German and French month names and abbreviations (transliterated, lower case)
+MONTH_NAMES = (
+    ("january", "jan", "januar", "jaenner", "janvier"),
+    ("february", "feb", "februar", "fevrier", "fev"),
+    ("march", "mar", "maerz", "marz", "mrz", "mars"),
+    ("april", "apr", "avril", "avr"),
+    ("may", "mai"),
+    ("june", "jun", "juni", "juin"),
+    ("july", "jul", "juli", "juillet", "juil"),
+    ("august", "aug", "aout"),
+    ("september", "sep", "sept", "septembre"),
+    ("october", "oct", "oktober", "okt", "octobre"),
+    ("november", "nov", "novembre"),
+    ("december", "dec", "dezember", "dez", "decembre"),
+)
+MONTHS = {name: number for number, names in enumerate(MONTH_NAMES, start=1) for name in names}
+
+TRANSLITERATIONS = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "é": "e", "è": "e", "û": "u"})
+
+_MONTH = r"([a-z]+)\.?(?:\s*/\s*[a-z]+\.?)?"  # "jun", "jun.", "jun /juin" (bilingual passports)
+NUMERIC_PATTERN = re.compile(r"(\d{1,2})\s*[./-]\s*(\d{1,2})\s*[./-]\s*(\d{4}|\d{2})")
+ISO_PATTERN = re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})(?:[t ][\d:.+z-]*)?")
+MRZ_PATTERN = re.compile(r"(\d{2})(\d{2})(\d{2})")
+DAY_MONTH_YEAR_PATTERN = re.compile(r"(\d{1,2})(?:st|nd|rd|th)?\.?\s*" + _MONTH + r",?\s*(\d{4})")
+MONTH_DAY_YEAR_PATTERN = re.compile(_MONTH + r"\s+(\d{1,2})(?:st|nd|rd|th)?,?\s+(\d{4})")
+
+# Numeric and ISO dates inside free text, e.g. "01.03.2023 - 28.02.2025"
+DATE_SEARCH_PATTERN = re.compile(r"\b\d{4}-\d{1,2}-\d{1,2}\b|\b\d{1,2}[./-]\d{1,2}[./-]\d{2,4}\b")
+
+
+def _make_date(year, month, day):
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def _two_digit_year(year, birth=False):
+    pivot = date.today().year % 100 if birth else CENTURY_PIVOT
+    return 2000 + year if year <= pivot else 1900 + year
+
+
+def parse_mrz_date(value, birth=False):
+    """
+    Return the date of an MRZ YYMMDD field (e.g. "240612"), or None. Pass birth=True for
+    the date of birth field, so that e.g. "450312" is read as 1945 rather than 2045.
+    """
+    match = MRZ_PATTERN.fullmatch(str(value).strip())
+    if not match:
+        return None
+    return _make_date(_two_digit_year(int(match.group(1)), birth), int(match.group(2)), int(match.group(3)))
+
+
+@lru_cache(maxsize=4096)
+def _parse(text):
+    match = NUMERIC_PATTERN.fullmatch(text)
+    if match:
+        day, month, year = (int(group) for group in match.groups())
+        return _make_date(year if year >= 100 else _two_digit_year(year), month, day)
+    match = ISO_PATTERN.fullmatch(text)
+    if match:
+        year, month, day = (int(group) for group in match.groups())
+        return _make_date(year, month, day)
+    match = DAY_MONTH_YEAR_PATTERN.fullmatch(text)
+    if match and match.group(2) in MONTHS:
+        return _make_date(int(match.group(3)), MONTHS[match.group(2)], int(match.group(1)))
+    match = MONTH_DAY_YEAR_PATTERN.fullmatch(text)
+    if match and match.group(1) in MONTHS:
+        return _make_date(int(match.group(3)), MONTHS[match.group(1)], int(match.group(2)))
+    return None
+
+
+def normalize_date(value):
+    """Return `value` as a `datetime.date`, or None if it is not a recognized date."""
+    if isinstance(value, date):
+        return value
+    if not isinstance(value, str):
+        return None
+    return _parse(" ".join(value.lower().translate(TRANSLITERATIONS).split()).strip(" .,"))
+
+
+def format_date(value, date_format=STANDARD_FORMAT):
+    """Return `value` rewritten in `date_format` (DD.MM.YYYY by default), or None if it is not a date."""
+    parsed = normalize_date(value)
+    return parsed.strftime(date_format) if parsed else None
+
+
+def find_dates(text):
+    """Return the numeric and ISO dates in a free text, in order of appearance."""
+    dates = (normalize_date(match.group(0)) for match in DATE_SEARCH_PATTERN.finditer(str(text)))
+    return [found for found in dates if found]
+
+
+def same_date(value1, value2):
+    """True if both values are dates and denote the same day, whatever their format."""
+    date1 = normalize_date(value1)
+    return date1 is not None and date1 == normalize_date(value2)
@@ -0,0 +1,174 @@
+"""
+Local, deterministic comparison of the employer declaration with the employment
+contract. Both documents are extracted into `StructuredOCRResponseforContract`
+fields; each field is normalized according to its kind (names, addresses, dates,
+amounts, durations, flags) and compared, and the result has the same shape as the
+former model answer: {"similarities": [...], "differences": [...], "classification": ...}.
+"""
+
+import re
+import unicodedata
+from datetime import timedelta
+from .date_normalization import find_dates, normalize_date
+
+# green if every field matches, yellow if at most this share of the fields differs, red otherwise
+MAX_YELLOW_MISMATCH_PERCENT = 20
+
+# Field kinds of StructuredOCRResponseforContract; unlisted fields are compared as plain text
+FIELD_KINDS = {
+    "employee_name": "name",
+    "employee_address": "address",
+    "employee_salary_per_month_brutto": "amount",
+    "employee_profession": "text",
+    "employment_start_date": "date",
+    "employment_duration": "duration",
+    "employer_name": "name",
+    "employer_address": "address",
+    "employer_signature_present": "flag",
+}
+
+# German letters are transliterated first, so "München" and "Muenchen" normalize alike
+TRANSLITERATIONS = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss"})
+
+# Whole-word abbreviations in addresses, applied after transliteration and lower-casing.
+# State and country are dropped: the postcode already identifies them and they are often omitted.
+ADDRESS_ABBREVIATIONS = {
+    "strasse": "str",
+    "street": "str",
+    "st": "str",
+    "platz": "pl",
+    "nr": "",
+    "no": "",
+    "muenchen": "munich",
+    "bayern": "",
+    "bavaria": "",
+    "germany": "",
+    "deutschland": "",
+}
+STREET_SUFFIX_PATTERN = re.compile(r"(\w)(strasse|str)\b")  # "theresienstrasse" -> "theresien str"
+
+UNLIMITED_DURATIONS = {"unlimited", "unbefristet", "permanent", "indefinite", "open ended", "open-ended", "unbegrenzt"}
+DURATION_PATTERN = re.compile(r"(\d+(?:[.,]\d+)?)\s*(year|years|jahr|jahre|jahren|month|months|monat|monate|monaten)\b")
+
+FLAG_VALUES = {"true": True, "yes": True, "ja": True, "1": True, "false": False, "no": False, "nein": False, "0": False}
+
+
+def normalize_text(value):
+    """Lower-case, transliterate, strip accents and punctuation, and collapse whitespace."""
+    text = str(value).lower().translate(TRANSLITERATIONS)
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(re.sub(r"[^\w\s]", " ", text).split())
+
+
+def normalize_name(value):
+    """Names compare as a set of words, so "Singhal, Deepti" matches "Deepti Singhal"."""
+    return frozenset(normalize_text(value).split())
+
+
+def normalize_address(value):
+    """Addresses compare as a set of words with street and city abbreviations expanded alike."""
+    text = STREET_SUFFIX_PATTERN.sub(r"\1 \2", normalize_text(value))
+    words = (ADDRESS_ABBREVIATIONS.get(word, word) for word in text.split())
+    return frozenset(word for word in words if word)
+
+
+def parse_amount(value):
+    """
+    Return the number in a money string such as "5.000,00 €", "EUR 5,000.00" or "4800",
+    or None if there is none. The last "." or "," is read as the decimal separator only
+    if it is not followed by exactly three digits (a thousands group).
+    """
+    match = re.search(r"\d[\d.,\s]*", str(value))
+    if not match:
+        return None
+    number = re.sub(r"\s", "", match.group(0)).rstrip(".,")
+    separator_position = max(number.rfind("."), number.rfind(","))
+    if separator_position == -1:
+        return float(number)
+    integer_part, fraction = number[:separator_position], number[separator_position + 1:]
+    if len(fraction) == 3:
+        return float(re.sub(r"[.,]", "", number))
+    return float(re.sub(r"[.,]", "", integer_part) + "." + fraction)
+
+
+def normalize_duration(value):
+    """
+    Return "unlimited", a number of months (summed over all parts, so "1 year 6 months"
+    is 18), or the normalized text if the duration is not recognized. A period written
+    as two dates ("01.03.2023 - 29.02.2024") counts whole months.
+    """
+    dates = find_dates(value)
+    if len(dates) == 2:
+        start, end = dates[0], dates[1] + timedelta(days=1)  # The end date is the last working day
+        return float((end.year - start.year) * 12 + end.month - start.month - (end.day < start.day))
+    text = normalize_text(value)
+    if text in UNLIMITED_DURATIONS or any(word in UNLIMITED_DURATIONS for word in text.split()):
+        return "unlimited"
+    # Matched before punctuation is stripped, so "1,5 years" keeps its decimal separator
+    matches = DURATION_PATTERN.findall(str(value).lower())
+    if matches:
+        return sum(float(amount.replace(",", ".")) * (12 if unit.startswith(("year", "jahr")) else 1)
+                   for amount, unit in matches)
+    return text
+
+
+def normalize_flag(value):
+    if isinstance(value, bool):
+        return value
+    return FLAG_VALUES.get(normalize_text(value), normalize_text(value))
+
+
+NORMALIZERS = {
+    "name": normalize_name,
+    "address": normalize_address,
+    "date": lambda value: normalize_date(value) or normalize_text(value),
+    "amount": lambda value: parse_amount(value) if parse_amount(value) is not None else normalize_text(value),
+    "duration": normalize_duration,
+    "flag": normalize_flag,
+    "text": normalize_text,
+}
+
+
+def is_blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def compare_field(field, declaration_value, contract_value):
+    """Return True if the two values of `field` mean the same thing."""
+    if is_blank(declaration_value) or is_blank(contract_value):
+        return is_blank(declaration_value) and is_blank(contract_value)
+    normalize = NORMALIZERS[FIELD_KINDS.get(field, "text")]
+    declaration_normalized, contract_normalized = normalize(declaration_value), normalize(contract_value)
+    if isinstance(declaration_normalized, float) and isinstance(contract_normalized, float):
+        return abs(declaration_normalized - contract_normalized) < 0.01
+    return declaration_normalized == contract_normalized
+
+
+def classify_mismatches(mismatches, total):
+    """green for no mismatch, yellow for at most MAX_YELLOW_MISMATCH_PERCENT of the fields, red otherwise."""
+    if mismatches == 0:
+        return "green"
+    # Integer arithmetic, so exactly 20% is still yellow
+    return "yellow" if mismatches * 100 <= MAX_YELLOW_MISMATCH_PERCENT * total else "red"
+
+
+def compare_declaration_with_contract(declaration_details, contract_details):
+    """
+    Compare the employer declaration with the contract for the fields present in the
+    contract details (both dicts of `StructuredOCRResponseforContract` fields).
+    Returns {"similarities": [...], "differences": [...], "classification": "green"|"yellow"|"red"}.
+    """
+    similarities, differences = [], []
+    for field, contract_value in contract_details.items():
+        declaration_value = declaration_details.get(field)
+        label = field.replace("_", " ").capitalize()
+        if compare_field(field, declaration_value, contract_value):
+            similarities.append(f"{label}: '{contract_value}' matches")
+        else:
+            differences.append(f"{label}: declaration states '{declaration_value}', contract states '{contract_value}'")
+    return {
+        "similarities": similarities,
+        "differences": differences,
+        "classification": classify_mismatches(len(differences), len(contract_details)),
+    }
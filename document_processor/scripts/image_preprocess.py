@@ -0,0 +1,99 @@
+import os
+import hashlib
+import numpy as np
+from PIL import Image, ImageFilter, ImageOps
+from .image_quality import to_grayscale_array, estimate_skew
+
+# Longest side (px) sent to the vision models; larger scans only add payload
+TARGET_MAX_SIDE = int(os.getenv("PREPROCESS_MAX_SIDE", "1600"))
+JPEG_QUALITY = 90
+MIN_DESKEW_DEGREES = 0.5      # Smaller estimated skews are left alone
+BACKGROUND_TOLERANCE = 30     # Grey levels a pixel must differ from the border to count as document
+CROP_MARGIN = 0.02            # Fraction of the document size kept around the crop
+PREPROCESSED_SUFFIX = ".prep.jpg"
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """Return a short SHA-256 hex digest of the file contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def preprocessed_path(image_path, digest):
+    """Return the cache path for the preprocessed version of `image_path`, stored next to the original."""
+    stem, _ = os.path.splitext(image_path)
+    return f"{stem}.{digest}{PREPROCESSED_SUFFIX}"
+
+
+def flatten_to_rgb(image):
+    """Convert to RGB, compositing any transparency onto a white background."""
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def crop_to_document(image):
+    """Crop away the uniform background around the document, keeping a small margin."""
+    gray = np.asarray(image.convert("L"), dtype=np.int16)
+    border = np.concatenate([gray[0, :], gray[-1, :], gray[:, 0], gray[:, -1]])
+    mask = np.abs(gray - int(np.median(border))) > BACKGROUND_TOLERANCE
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    if rows.size == 0 or cols.size == 0:
+        return image
+
+    margin_y = int((rows[-1] - rows[0]) * CROP_MARGIN)
+    margin_x = int((cols[-1] - cols[0]) * CROP_MARGIN)
+    box = (
+        max(0, cols[0] - margin_x),
+        max(0, rows[0] - margin_y),
+        min(image.width, cols[-1] + margin_x + 1),
+        min(image.height, rows[-1] + margin_y + 1),
+    )
+    return image.crop(box)
+
+
+def preprocess_image(image, deskew=True):
+    """
+    Normalize a scan for the vision models: deskew, crop to the document,
+    downscale to TARGET_MAX_SIDE, stretch contrast and remove speckle noise.
+    Deskewing relies on text lines, so disable it for signatures.
+    """
+    image = flatten_to_rgb(image)
+
+    if deskew:
+        skew = estimate_skew(to_grayscale_array(image))
+        if abs(skew) >= MIN_DESKEW_DEGREES:
+            image = image.rotate(-skew, resample=Image.BICUBIC, expand=True, fillcolor=(255, 255, 255))
+
+    image = crop_to_document(image)
+    image.thumbnail((TARGET_MAX_SIDE, TARGET_MAX_SIDE), Image.LANCZOS)
+    image = ImageOps.autocontrast(image, cutoff=1)
+    return image.filter(ImageFilter.MedianFilter(3))
+
+
+def get_preprocessed_image(image_path, deskew=True):
+    """
+    Return the path of the preprocessed version of `image_path`, creating it on first use.
+    The result is cached next to the original, keyed by the original's content hash,
+    so each upload is processed only once. Falls back to the original path on error.
+    """
+    try:
+        cache_path = preprocessed_path(image_path, file_digest(image_path))
+        if not os.path.exists(cache_path):
+            with Image.open(image_path) as image:
+                processed = preprocess_image(image, deskew=deskew)
+            # Write to a temporary file first so concurrent readers never see a partial image
+            tmp_path = f"{cache_path}.tmp"
+            processed.save(tmp_path, format="JPEG", quality=JPEG_QUALITY)
+            os.replace(tmp_path, cache_path)
+        return cache_path
+    except Exception as e:
+        print(f"Error preprocessing image {image_path}: {e}")
+        return image_path
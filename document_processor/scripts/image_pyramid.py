@@ -0,0 +1,122 @@
+"""
+Multi-resolution tile pyramids for document scans shown in the zoom views.
+A pyramid is generated once per file content hash: a small preview plus, per level,
+the image halved in size `level` times and cut into TILE_SIZE tiles. Viewers send the
+preview by default and decode only the few tiles under a zoomed region, so neither
+the server nor the browser has to handle the full-resolution scan on every rerun.
+"""
+
+import os
+import json
+import math
+import shutil
+from PIL import Image
+from .image_preprocess import file_digest, flatten_to_rgb
+
+PYRAMID_ROOT = os.getenv(
+    "PYRAMID_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "pyramids"),
+)
+TILE_SIZE = int(os.getenv("PYRAMID_TILE_SIZE", "512"))        # Tile side, px
+PREVIEW_SIDE = int(os.getenv("PYRAMID_PREVIEW_SIDE", "800"))  # Longest side of the preview, px
+JPEG_QUALITY = 90
+META_FILE = "pyramid.json"
+PREVIEW_FILE = "preview.jpg"
+
+
+def tile_path(pyramid, level, col, row):
+    """Return the path of one tile of a pyramid returned by `get_image_pyramid`."""
+    return os.path.join(pyramid["path"], str(level), f"{col}_{row}.jpg")
+
+
+def pyramid_preview_path(pyramid):
+    """Return the path of the preview image of a pyramid returned by `get_image_pyramid`."""
+    return os.path.join(pyramid["path"], PREVIEW_FILE)
+
+
+def _save_jpeg(image, path):
+    image.save(path, format="JPEG", quality=JPEG_QUALITY)
+
+
+def build_pyramid(image, target_dir):
+    """Write the preview, the tiles of every level and the pyramid.json index for `image` into `target_dir`."""
+    image = flatten_to_rgb(image)
+    width, height = image.size
+
+    preview = image.copy()
+    preview.thumbnail((PREVIEW_SIDE, PREVIEW_SIDE), Image.LANCZOS)
+    _save_jpeg(preview, os.path.join(target_dir, PREVIEW_FILE))
+
+    # Level 0 is the full resolution; halve until the whole image fits in one tile
+    levels = []
+    level_image = image
+    level = 0
+    while True:
+        level_width, level_height = level_image.size
+        cols, rows = math.ceil(level_width / TILE_SIZE), math.ceil(level_height / TILE_SIZE)
+        os.makedirs(os.path.join(target_dir, str(level)))
+        for col in range(cols):
+            for row in range(rows):
+                box = (col * TILE_SIZE, row * TILE_SIZE,
+                       min((col + 1) * TILE_SIZE, level_width), min((row + 1) * TILE_SIZE, level_height))
+                _save_jpeg(level_image.crop(box), os.path.join(target_dir, str(level), f"{col}_{row}.jpg"))
+        levels.append({"level": level, "width": level_width, "height": level_height, "cols": cols, "rows": rows})
+        if cols == 1 and rows == 1:
+            break
+        level_image = level_image.resize((max(1, level_width // 2), max(1, level_height // 2)), Image.LANCZOS)
+        level += 1
+
+    meta = {"width": width, "height": height, "tile_size": TILE_SIZE, "levels": levels}
+    with open(os.path.join(target_dir, META_FILE), "w") as f:
+        json.dump(meta, f)
+    return meta
+
+
+def get_image_pyramid(image_path):
+    """
+    Return the pyramid for `image_path` (its index plus "path", the pyramid directory),
+    building it on first use. Pyramids are keyed by content hash, so each scan is
+    decoded and tiled only once. Returns None on error.
+    """
+    try:
+        pyramid_dir = os.path.join(PYRAMID_ROOT, file_digest(image_path))
+        meta_path = os.path.join(pyramid_dir, META_FILE)
+        if not os.path.exists(meta_path):
+            # Build in a private directory and rename it into place, so concurrent
+            # readers never see a partial pyramid
+            os.makedirs(PYRAMID_ROOT, exist_ok=True)
+            tmp_dir = f"{pyramid_dir}.tmp-{os.getpid()}"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+            with Image.open(image_path) as image:
+                build_pyramid(image, tmp_dir)
+            try:
+                os.replace(tmp_dir, pyramid_dir)
+            except OSError:
+                shutil.rmtree(tmp_dir, ignore_errors=True)  # Built concurrently by another process
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        meta["path"] = pyramid_dir
+        return meta
+    except Exception as e:
+        print(f"Error building image pyramid for {image_path}: {e}")
+        return None
+
+
+def pyramid_region(pyramid, level, center, size=TILE_SIZE):
+    """
+    Return a PIL image of the `size` x `size` window (level pixels) of pyramid `level`
+    centred at `center` (x, y as fractions of the image), decoding only the tiles it covers.
+    """
+    info = pyramid["levels"][level]
+    tile = pyramid["tile_size"]
+    width, height = min(size, info["width"]), min(size, info["height"])
+    left = min(max(0, round(center[0] * info["width"] - width / 2)), info["width"] - width)
+    top = min(max(0, round(center[1] * info["height"] - height / 2)), info["height"] - height)
+
+    region = Image.new("RGB", (width, height), "white")
+    for col in range(left // tile, (left + width - 1) // tile + 1):
+        for row in range(top // tile, (top + height - 1) // tile + 1):
+            with Image.open(tile_path(pyramid, level, col, row)) as tile_image:
+                region.paste(tile_image, (col * tile - left, row * tile - top))
+    return region
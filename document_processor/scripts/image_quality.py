@@ -0,0 +1,134 @@
+import os
+import numpy as np
+from PIL import Image
+
+# Size (longest side, px) the image is reduced to before analysis
+ANALYSIS_SIZE = 1024
+
+# Quality thresholds (overridable from the .env file). A metric exactly at its
+# threshold scores 0.5; comfortably good values score 1.0.
+MIN_SHARPNESS = float(os.getenv("QUALITY_MIN_SHARPNESS", "40.0"))        # Laplacian variance
+MAX_SKEW_DEGREES = float(os.getenv("QUALITY_MAX_SKEW_DEGREES", "8.0"))
+MIN_CONTRAST = float(os.getenv("QUALITY_MIN_CONTRAST", "60.0"))          # 5th-95th percentile spread
+MIN_RESOLUTION = int(os.getenv("QUALITY_MIN_RESOLUTION", "400"))         # Shorter side, px
+MAX_CLIPPED_FRACTION = float(os.getenv("QUALITY_MAX_CLIPPED_FRACTION", "0.6"))
+# Scans scoring below this are rejected outright instead of being sent to a vision model
+REJECT_SCORE = float(os.getenv("QUALITY_REJECT_SCORE", "0.25"))
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+def to_grayscale_array(image, size=ANALYSIS_SIZE):
+    """Convert a PIL image to a float32 grayscale array whose longest side is at most `size`."""
+    gray = image.convert("L")
+    gray.thumbnail((size, size), Image.BILINEAR)
+    return np.asarray(gray, dtype=np.float32)
+
+
+def laplacian_variance(gray):
+    """Variance of the 4-neighbour Laplacian; low values indicate a blurred image."""
+    laplacian = (
+        gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+        - 4 * gray[1:-1, 1:-1]
+    )
+    return float(laplacian.var())
+
+
+def _projection_score(ink, angle):
+    rotated = np.asarray(ink.rotate(angle, resample=Image.NEAREST))
+    return float(np.var(rotated.sum(axis=1)))
+
+
+def estimate_skew(gray, max_angle=15.0):
+    """
+    Estimate the text skew angle in degrees (counter-clockwise, as used by `Image.rotate`)
+    by maximizing the variance of the horizontal projection profile of dark pixels.
+    Rotating the image by the negated result deskews it.
+    """
+    ink = Image.fromarray(((gray < gray.mean() - gray.std()) * 255).astype(np.uint8))
+    ink.thumbnail((512, 512), Image.NEAREST)
+
+    # Coarse search in 1 degree steps, then refine around the best angle
+    coarse = np.arange(-max_angle, max_angle + 1, 1.0)
+    best = max(coarse, key=lambda a: _projection_score(ink, a))
+    fine = np.arange(best - 1, best + 1.01, 0.25)
+    best = max(fine, key=lambda a: _projection_score(ink, a))
+    return float(-best)
+
+
+def exposure_stats(gray):
+    """Return brightness statistics from the grayscale histogram."""
+    histogram = np.bincount(gray.astype(np.uint8).ravel(), minlength=256)
+    cumulative = np.cumsum(histogram) / histogram.sum()
+    p5 = int(np.searchsorted(cumulative, 0.05))
+    p95 = int(np.searchsorted(cumulative, 0.95))
+    return {
+        "mean": float(gray.mean()),
+        "contrast": float(p95 - p5),
+        "dark_fraction": float(cumulative[15]),
+        "bright_fraction": float(1 - cumulative[239]),
+    }
+
+
+def assess_image_quality(image):
+    """
+    Run local quality checks (blur, skew, exposure, resolution) on an image path,
+    file-like object or PIL image.
+
+    Returns:
+        dict with keys:
+          - "score": overall quality between 0 and 1 (the weakest check dominates)
+          - "acceptable": False if the scan should be rejected without a model call
+          - "issues": human-readable reasons for every check below its threshold
+          - "metrics": the raw measurements
+    """
+    if not isinstance(image, Image.Image):
+        with Image.open(image) as opened:
+            opened.load()
+            image = opened.copy()
+
+    width, height = image.size
+    gray = to_grayscale_array(image)
+    sharpness = laplacian_variance(gray)
+    skew = estimate_skew(gray)
+    exposure = exposure_stats(gray)
+    clipped = max(exposure["dark_fraction"], exposure["bright_fraction"])
+
+    scores = {
+        "sharpness": min(1.0, sharpness / (2 * MIN_SHARPNESS)),
+        "skew": max(0.0, 1 - abs(skew) / (2 * MAX_SKEW_DEGREES)),
+        "contrast": min(1.0, exposure["contrast"] / (2 * MIN_CONTRAST)),
+        "resolution": min(1.0, min(width, height) / (2 * MIN_RESOLUTION)),
+        "exposure": min(1.0, max(0.0, 1 - clipped) / (2 * (1 - MAX_CLIPPED_FRACTION))),
+    }
+
+    issues = []
+    if scores["sharpness"] < 0.5:
+        issues.append(f"Image is too blurry (sharpness {sharpness:.0f}, minimum {MIN_SHARPNESS:.0f}).")
+    if scores["skew"] < 0.5:
+        issues.append(f"Document is tilted by about {abs(skew):.1f} degrees (maximum {MAX_SKEW_DEGREES:.0f}).")
+    if scores["contrast"] < 0.5:
+        issues.append(f"Contrast is too low ({exposure['contrast']:.0f}, minimum {MIN_CONTRAST:.0f}).")
+    if scores["resolution"] < 0.5:
+        issues.append(f"Resolution is too low ({width}x{height}, shorter side must be at least {MIN_RESOLUTION}px).")
+    if scores["exposure"] < 0.5:
+        issues.append("Image is over- or under-exposed.")
+
+    score = min(scores.values())
+    return {
+        "score": round(score, 3),
+        "acceptable": score >= REJECT_SCORE,
+        "issues": issues,
+        "metrics": {
+            "width": width,
+            "height": height,
+            "sharpness": round(sharpness, 1),
+            "skew_degrees": round(skew, 2),
+            **{key: round(value, 3) for key, value in exposure.items()},
+        },
+    }
+
+
+def is_image_file(file_name):
+    """Return True if the file name has an image extension the quality checks support."""
+    return str(file_name).lower().endswith(IMAGE_EXTENSIONS)
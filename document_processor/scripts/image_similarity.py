@@ -0,0 +1,169 @@
+import io
+import os
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+from .image_preprocess import flatten_to_rgb, crop_to_document
+
+# Decision thresholds (overridable from the .env file). Only clear mismatches are decided
+# from the perceptual scores: a small edit (e.g. an overwritten date of birth) barely moves
+# SSIM or the hashes of a thumbnail, so a "match" requires the images to be identical at
+# full resolution. Everything else is "ambiguous" and delegated to the vision model.
+MISMATCH_SSIM = float(os.getenv("SIMILARITY_MISMATCH_SSIM", "0.30"))
+MISMATCH_HASH_DISTANCE = int(os.getenv("SIMILARITY_MISMATCH_HASH_DISTANCE", "26"))  # Out of 64 bits
+MAX_PIXEL_DIFFERENCE = int(os.getenv("SIMILARITY_MAX_PIXEL_DIFFERENCE", "0"))        # Per channel, 0-255
+
+COMPARE_SIZE = 128   # Side of the square, normalized crop used for scoring
+SSIM_WINDOW = 7
+CACHE_SIZE = 256     # Memoized comparisons kept per process
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def load_image_bytes(source):
+    """Return the raw bytes of an image given as a path, bytes, or base64 string."""
+    if isinstance(source, bytes):
+        return source
+    if isinstance(source, str) and os.path.exists(source):
+        with open(source, "rb") as f:
+            return f.read()
+    return base64.b64decode(source.split("base64,")[-1])
+
+
+def normalize_for_comparison(image_bytes):
+    """Crop to the document and return a float32 grayscale COMPARE_SIZE x COMPARE_SIZE array."""
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image = crop_to_document(flatten_to_rgb(image)).convert("L")
+    return np.asarray(image.resize((COMPARE_SIZE, COMPARE_SIZE), Image.BILINEAR), dtype=np.float32)
+
+
+def pixels_identical(image_bytes1, image_bytes2):
+    """True if both images decode to the same size and no pixel differs by more than MAX_PIXEL_DIFFERENCE."""
+    with Image.open(io.BytesIO(image_bytes1)) as image1, Image.open(io.BytesIO(image_bytes2)) as image2:
+        pixels1 = np.asarray(flatten_to_rgb(image1), dtype=np.int16)
+        pixels2 = np.asarray(flatten_to_rgb(image2), dtype=np.int16)
+    return pixels1.shape == pixels2.shape and int(np.abs(pixels1 - pixels2).max()) <= MAX_PIXEL_DIFFERENCE
+
+
+def _dct_matrix(n):
+    k = np.arange(n)
+    matrix = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n))
+    matrix[0] /= np.sqrt(2)
+    return matrix * np.sqrt(2 / n)
+
+
+_DCT_32 = _dct_matrix(32)
+
+
+def perceptual_hash(gray):
+    """64-bit pHash: signs of the low-frequency 8x8 DCT block (without DC) against its median."""
+    small = np.asarray(Image.fromarray(gray).resize((32, 32), Image.BILINEAR), dtype=np.float64)
+    low = (_DCT_32 @ small @ _DCT_32.T)[:8, :8].ravel()[1:]
+    return np.append(low > np.median(low), False)
+
+
+def difference_hash(gray):
+    """64-bit dHash: whether each pixel is brighter than its right neighbour on a 9x8 thumbnail."""
+    small = np.asarray(Image.fromarray(gray).resize((9, 8), Image.BILINEAR), dtype=np.float64)
+    return (small[:, 1:] > small[:, :-1]).ravel()
+
+
+def _window_mean(values, size=SSIM_WINDOW):
+    """Mean over every size x size window, computed with an integral image."""
+    integral = np.pad(values, ((1, 0), (1, 0))).cumsum(axis=0).cumsum(axis=1)
+    window_sum = (integral[size:, size:] - integral[:-size, size:]
+                  - integral[size:, :-size] + integral[:-size, :-size])
+    return window_sum / (size * size)
+
+
+def structural_similarity(a, b):
+    """Mean SSIM of two equally sized grayscale arrays over sliding windows."""
+    a = a.astype(np.float64)
+    b = b.astype(np.float64)
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    mu_a, mu_b = _window_mean(a), _window_mean(b)
+    var_a = _window_mean(a * a) - mu_a ** 2
+    var_b = _window_mean(b * b) - mu_b ** 2
+    covariance = _window_mean(a * b) - mu_a * mu_b
+    ssim_map = ((2 * mu_a * mu_b + c1) * (2 * covariance + c2)) / ((mu_a ** 2 + mu_b ** 2 + c1) * (var_a + var_b + c2))
+    return float(ssim_map.mean())
+
+
+def compare_images_locally(source1, source2):
+    """
+    Compare two images (paths, bytes or base64 strings) without a model call.
+    Results are memoized by content hash (the CACHE_SIZE most recent pairs), so repeated
+    calls for the same pair are free.
+
+    Returns:
+        dict with keys:
+          - "decision": "match" (identical bytes or pixels), "mismatch" (clearly different)
+            or "ambiguous" (everything else; only ambiguous pairs need a model)
+          - "identical": True if the files are byte-identical
+          - "pixel_identical": True if the images are identical at full resolution
+          - "score": SSIM between the normalized crops (1.0 for identical images, None if undecodable)
+          - "phash_distance" / "dhash_distance": Hamming distances out of 64 bits
+    """
+    try:
+        bytes1, bytes2 = load_image_bytes(source1), load_image_bytes(source2)
+    except Exception as e:
+        print(f"Error loading images for local comparison: {e}")
+        return {"decision": "ambiguous", "identical": False, "pixel_identical": False,
+                "score": None, "phash_distance": None, "dhash_distance": None}
+    key = (hashlib.sha256(bytes1).hexdigest(), hashlib.sha256(bytes2).hexdigest())
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    if key[0] == key[1]:
+        result = {"decision": "match", "identical": True, "pixel_identical": True,
+                  "score": 1.0, "phash_distance": 0, "dhash_distance": 0}
+    else:
+        try:
+            gray1, gray2 = normalize_for_comparison(bytes1), normalize_for_comparison(bytes2)
+            pixel_identical = pixels_identical(bytes1, bytes2)
+        except Exception as e:
+            # Undecodable images are left for the vision model to judge
+            print(f"Error decoding images for local comparison: {e}")
+            return {"decision": "ambiguous", "identical": False, "pixel_identical": False,
+                    "score": None, "phash_distance": None, "dhash_distance": None}
+        score = structural_similarity(gray1, gray2)
+        phash_distance = int(np.count_nonzero(perceptual_hash(gray1) != perceptual_hash(gray2)))
+        dhash_distance = int(np.count_nonzero(difference_hash(gray1) != difference_hash(gray2)))
+
+        if pixel_identical:
+            decision = "match"
+        elif score <= MISMATCH_SSIM and phash_distance >= MISMATCH_HASH_DISTANCE:
+            decision = "mismatch"
+        else:
+            decision = "ambiguous"
+        result = {
+            "decision": decision,
+            "identical": False,
+            "pixel_identical": pixel_identical,
+            "score": round(score, 4),
+            "phash_distance": phash_distance,
+            "dhash_distance": dhash_distance,
+        }
+
+    with _cache_lock:
+        _cache[key] = result
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
+
+
+def describe_local_comparison(result, subject="images"):
+    """Return a short text summary of a decided local comparison, suitable for the final analysis prompt."""
+    if result["identical"]:
+        return f"Local comparison: the two {subject} are byte-for-byte identical files."
+    if result["decision"] == "match":
+        return f"Local comparison: the two {subject} are pixel-for-pixel identical at full resolution."
+    details = (f"(similarity score {result['score']:.2f}, perceptual hash distance "
+               f"{result['phash_distance']} of 64)")
+    return f"Local comparison: the two {subject} are clearly different {details}; they do not match."
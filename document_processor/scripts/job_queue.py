@@ -0,0 +1,135 @@
+"""
+Durable, SQLite-backed job queue shared by the candidate portal (producer) and the
+analysis worker (consumer). Jobs survive restarts; a job claimed by a worker that
+dies is handed out again once its lease expires, and failed jobs are retried with
+backoff; either way a job is run at most MAX_ATTEMPTS times.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+QUEUE_FILE = os.getenv(
+    "JOB_QUEUE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "jobs.db"),
+)
+LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "900"))   # A running job is reclaimed after this long
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "60"))        # Seconds, doubled on every retry
+
+_local = threading.local()
+
+
+def _connect():
+    """Return this thread's connection, creating the database and schema on first use."""
+    connection = getattr(_local, "connection", None)
+    if connection is None:
+        os.makedirs(os.path.dirname(QUEUE_FILE), exist_ok=True)
+        connection = sqlite3.connect(QUEUE_FILE, timeout=30, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " kind TEXT NOT NULL,"
+            " job_key TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " status TEXT NOT NULL DEFAULT 'queued',"   # queued | running | done | failed
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " available_at REAL NOT NULL,"
+            " locked_at REAL,"
+            " error TEXT,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        # At most one pending job per key, so resubmitting does not queue duplicate work
+        connection.execute("CREATE UNIQUE INDEX IF NOT EXISTS jobs_pending_key ON jobs (kind, job_key) "
+                           "WHERE status IN ('queued', 'running')")
+        connection.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at)")
+        _local.connection = connection
+    return connection
+
+
+def enqueue(kind, payload, key):
+    """
+    Queue a job unless one with the same kind and key is already pending.
+    Returns True if a new job was queued.
+    """
+    now = time.time()
+    cursor = _connect().execute(
+        "INSERT OR IGNORE INTO jobs (kind, job_key, payload, available_at, created_at, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (kind, key, json.dumps(payload), now, now, now),
+    )
+    return cursor.rowcount == 1
+
+
+def claim(kinds=None):
+    """
+    Atomically take the oldest ready job (or one whose worker's lease expired).
+    A job whose lease expired after its last allowed attempt (its worker was killed,
+    e.g. out of memory on a bad scan) is marked failed instead of being run again.
+    Returns a dict with "id", "kind", "key", "payload" and "attempts", or None if nothing is ready.
+    """
+    connection = _connect()
+    now = time.time()
+    kind_filter, params = "", [now, now - LEASE_SECONDS, MAX_ATTEMPTS]
+    if kinds:
+        kind_filter = f" AND kind IN ({', '.join('?' * len(kinds))})"
+        params.extend(kinds)
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        connection.execute(
+            "UPDATE jobs SET status = 'failed', error = 'lease expired', updated_at = ? "
+            "WHERE status = 'running' AND locked_at <= ? AND attempts >= ?",
+            (now, now - LEASE_SECONDS, MAX_ATTEMPTS),
+        )
+        row = connection.execute(
+            "SELECT id, kind, job_key, payload, attempts FROM jobs "
+            "WHERE ((status = 'queued' AND available_at <= ?) "
+            "OR (status = 'running' AND locked_at <= ? AND attempts < ?))"
+            f"{kind_filter} ORDER BY available_at, id LIMIT 1",
+            params,
+        ).fetchone()
+        if row is None:
+            connection.execute("COMMIT")
+            return None
+        connection.execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_at = ?, updated_at = ? WHERE id = ?",
+            (now, now, row[0]),
+        )
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    return {"id": row[0], "kind": row[1], "key": row[2], "payload": json.loads(row[3]), "attempts": row[4] + 1}
+
+
+def complete(job_id):
+    """Mark a claimed job as done."""
+    _connect().execute("UPDATE jobs SET status = 'done', error = NULL, updated_at = ? WHERE id = ?",
+                       (time.time(), job_id))
+
+
+def fail(job_id, error):
+    """Record a failure; the job is retried later unless it has used up MAX_ATTEMPTS."""
+    connection = _connect()
+    now = time.time()
+    attempts = connection.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+    if attempts >= MAX_ATTEMPTS:
+        connection.execute("UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                           (str(error), now, job_id))
+    else:
+        connection.execute(
+            "UPDATE jobs SET status = 'queued', error = ?, available_at = ?, updated_at = ? WHERE id = ?",
+            (str(error), now + RETRY_DELAY * 2 ** (attempts - 1), now, job_id),
+        )
+
+
+def job_status(kind, key):
+    """Return the status of the most recent job for a key ("queued", "running", "done", "failed"), or None."""
+    row = _connect().execute("SELECT status FROM jobs WHERE kind = ? AND job_key = ? ORDER BY id DESC LIMIT 1",
+                             (kind, key)).fetchone()
+    return row[0] if row else None
@@ -0,0 +1,269 @@
+import os
+import time
+import random
+import threading
+from contextlib import closing
+
+
+def read_settings():
+    """
+    (Re)read the tunables for the shared client pool (all overridable from the .env file).
+    Called at import with the process environment and again by `get_client` once the
+    .env file has been loaded, so importing this module has no side effects.
+    """
+    global MAX_CONCURRENCY, REQUESTS_PER_SECOND, BURST, MAX_RETRIES, BACKOFF_BASE, BACKOFF_MAX
+    global CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_COOLDOWN
+    MAX_CONCURRENCY = int(os.getenv("MISTRAL_MAX_CONCURRENCY", "4"))           # In-flight requests per process
+    REQUESTS_PER_SECOND = float(os.getenv("MISTRAL_REQUESTS_PER_SECOND", "1.0"))  # Sustained rate per model
+    BURST = int(os.getenv("MISTRAL_BURST", "2"))                               # Token bucket capacity per model
+    MAX_RETRIES = int(os.getenv("MISTRAL_MAX_RETRIES", "5"))
+    BACKOFF_BASE = float(os.getenv("MISTRAL_BACKOFF_BASE", "1.0"))             # Seconds
+    BACKOFF_MAX = float(os.getenv("MISTRAL_BACKOFF_MAX", "30.0"))              # Seconds
+    CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("MISTRAL_CIRCUIT_FAILURES", "5"))
+    CIRCUIT_COOLDOWN = float(os.getenv("MISTRAL_CIRCUIT_COOLDOWN", "60.0"))    # Seconds
+
+
+read_settings()
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when calls for a model are short-circuited after repeated failures."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket; `acquire` blocks until a token is available."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures and half-opens after `cooldown` seconds."""
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def check(self, key):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                # Half-open: let the next call through as a probe
+                self.opened_at = None
+                self.failures = self.threshold - 1
+                return
+        raise CircuitOpenError(f"Circuit open for '{key}' after {self.threshold} consecutive failures.")
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+def is_retryable(error):
+    """Return True for rate limiting (429), server errors (5xx) and transport failures."""
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    try:
+        import httpx
+        return isinstance(error, (httpx.TransportError, httpx.TimeoutException))
+    except ImportError:
+        return False
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff for the given retry attempt (0-based)."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+class ClientManager:
+    """
+    Process-wide manager around a single Mistral client.
+    Every request goes through a bounded semaphore, a per-model token bucket,
+    jittered exponential retries on 429/5xx and a per-model circuit breaker.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.semaphore = threading.BoundedSemaphore(MAX_CONCURRENCY)
+        self.buckets = {}
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def _limits_for(self, key):
+        with self.lock:
+            if key not in self.buckets:
+                self.buckets[key] = TokenBucket(REQUESTS_PER_SECOND, BURST)
+                self.breakers[key] = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_COOLDOWN)
+            return self.buckets[key], self.breakers[key]
+
+    def call(self, key, func, *args, **kwargs):
+        """Invoke `func(*args, **kwargs)` under the rate limit, concurrency cap and retry policy for `key`."""
+        bucket, breaker = self._limits_for(key)
+        attempt = 0
+        while True:
+            breaker.check(key)
+            bucket.acquire()
+            try:
+                with self.semaphore:
+                    result = func(*args, **kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                breaker.record_failure()
+                if attempt >= MAX_RETRIES:
+                    raise
+                delay = backoff_delay(attempt)
+                print(f"Retrying '{key}' in {delay:.1f}s after error: {e}")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            breaker.record_success()
+            return result
+
+    def stream(self, key, func, *args, **kwargs):
+        """
+        Streaming counterpart of `call`: yields the events of `func(*args, **kwargs)`.
+        Opening the stream is rate limited and retried like `call`; the concurrency slot
+        is held until the stream is exhausted or closed. Closing the generator early
+        (e.g. a cancelled analysis) closes the underlying HTTP response.
+        """
+        bucket, breaker = self._limits_for(key)
+        attempt = 0
+        while True:
+            breaker.check(key)
+            bucket.acquire()
+            self.semaphore.acquire()
+            try:
+                events = func(*args, **kwargs)
+            except Exception as e:
+                self.semaphore.release()
+                if not is_retryable(e):
+                    raise
+                breaker.record_failure()
+                if attempt >= MAX_RETRIES:
+                    raise
+                delay = backoff_delay(attempt)
+                print(f"Retrying '{key}' in {delay:.1f}s after error: {e}")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            try:
+                with events:
+                    yield from events
+            except Exception:
+                breaker.record_failure()
+                raise
+            finally:
+                self.semaphore.release()
+            breaker.record_success()
+            return
+
+
+class _ManagedResource:
+    """Proxy for a client resource (chat, ocr, files) that routes calls through the manager."""
+
+    def __init__(self, manager, resource, name):
+        self._manager = manager
+        self._resource = resource
+        self._name = name
+
+    def __getattr__(self, attr):
+        target = getattr(self._resource, attr)
+        if not callable(target):
+            return target
+
+        def managed(*args, **kwargs):
+            # Rate limits are tracked per model; model-less endpoints share one bucket per resource
+            key = kwargs.get("model") or self._name
+            if attr == "stream":
+                return self._manager.stream(key, target, *args, **kwargs)
+            return self._manager.call(key, target, *args, **kwargs)
+        return managed
+
+
+class ManagedClient:
+    """Drop-in replacement for a `Mistral` client whose calls are pooled, rate limited and retried."""
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    def __getattr__(self, attr):
+        return _ManagedResource(self.manager, getattr(self.manager.client, attr), attr)
+
+
+def stream_chat_text(client, **kwargs):
+    """
+    Yield the text of a streamed chat completion (`client.chat.stream(**kwargs)` on the
+    managed client) as it arrives. Closing this generator closes the stream.
+    """
+    with closing(client.chat.stream(**kwargs)) as events:
+        for event in events:
+            choices = event.data.choices
+            if choices and isinstance(choices[0].delta.content, str):
+                yield choices[0].delta.content
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Return the process-wide managed Mistral client, creating it on first use
+    (the .env file is loaded at that point, not at import).
+    Returns None if MISTRAL_API_KEY is not set.
+    """
+    global _client
+    if _client is not None:
+        return _client
+    with _client_lock:
+        if _client is None:
+            from dotenv import load_dotenv
+
+            load_dotenv()  # Does not override variables already set in the environment
+            read_settings()
+            api_key = os.getenv("MISTRAL_API_KEY")
+            if not api_key:
+                print("Error: MISTRAL_API_KEY is not set in the .env file.")
+                return None
+
+            import httpx
+            from mistralai import Mistral
+
+            # One keep-alive connection pool shared by every caller in the process
+            http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=MAX_CONCURRENCY, max_keepalive_connections=MAX_CONCURRENCY),
+                timeout=httpx.Timeout(120.0, connect=10.0),
+            )
+            _client = ManagedClient(ClientManager(Mistral(api_key=api_key, client=http_client)))
+    return _client
@@ -2,24 +2,28 @@ import os
 import sys
 import json
 import base64
-from dotenv import load_dotenv
-from mistralai import Mistral
-
-# Load environment variables from .env file
-load_dotenv()
-
-# Initialize the Mistral client
-MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
-if not MISTRAL_API_KEY:
-    print("Error: MISTRAL_API_KEY is not set in the .env file.")
-    sys.exit(1)
-client = Mistral(api_key=MISTRAL_API_KEY)
+from .mistral_client import get_client, stream_chat_text
+from .image_quality import assess_image_quality
+from .image_preprocess import get_preprocessed_image
+from .image_similarity import compare_images_locally, describe_local_comparison
+from .date_normalization import normalize_date, parse_mrz_date
 
 # Define models:
 EXTRACT_MODEL = "pixtral-12b-2409"            # Used for JSON extraction
 IMAGE_COMPARE_MODEL = "pixtral-large-latest"   # Used for image comparison
 FINAL_ANALYSIS_MODEL = "mistral-large-latest"    # Used for final analysis and classification
 
+# Tiered routing: run the fast model first and escalate to the large model only when needed
+ROUTING_MODE = os.getenv("PASSPORT_ROUTING_MODE", "tiered")      # "tiered" or "fixed"
+ESCALATION_MODEL = "pixtral-large-latest"                        # Used when the fast model is not good enough
+FAST_IMAGE_COMPARE_MODEL = "pixtral-12b-2409"                    # Used to compare clean, matching scans
+MIN_QUALITY_SCORE = float(os.getenv("PASSPORT_MIN_QUALITY_SCORE", "0.5"))  # Below this, go straight to the large model
+
+# Keys of the MRZ birth and expiry date fields, whose YYMMDD values are compared as dates
+MRZ_KEY_WORDS = ("mrz", "machine")  # e.g. "mrz_date_of_birth", or a "machine_readable_zone" object
+BIRTH_KEY_WORDS = ("birth", "dob")
+EXPIRY_KEY_WORDS = ("expir",)
+
 def encode_image(image_path):
     """Encode an image file to a base64 string."""
     try:
@@ -73,21 +77,60 @@ def extract_passport_data(image_path, client, model, schema=None):
         print(f"Error during inference for image {image_path}: {e}")
         return None
 
-def compare_passport_json(json1, json2):
+def field_date(value, key, in_mrz=False):
     """
-    Compare two passport JSON objects field by field.
-    Returns a string summarizing and highlighting the differences.
+    Return the date an extracted value denotes, or None. MRZ YYMMDD values are read
+    only for the birth and expiry date fields of the machine-readable zone.
+    """
+    parsed = normalize_date(value)
+    if parsed is not None:
+        return parsed
+    key = str(key).lower()
+    if not (in_mrz or any(word in key for word in MRZ_KEY_WORDS)):
+        return None
+    if any(word in key for word in BIRTH_KEY_WORDS):
+        return parse_mrz_date(value, birth=True)
+    if any(word in key for word in EXPIRY_KEY_WORDS):
+        return parse_mrz_date(value)
+    return None
+
+def same_value(v1, v2, key="", in_mrz=False):
+    """True if two extracted values are equal, comparing dates (at any nesting level) by the day they denote."""
+    if v1 == v2:
+        return True
+    in_mrz = in_mrz or any(word in str(key).lower() for word in MRZ_KEY_WORDS)
+    if isinstance(v1, dict) and isinstance(v2, dict):
+        return v1.keys() == v2.keys() and all(same_value(v1[k], v2[k], k, in_mrz) for k in v1)
+    if not (isinstance(v1, str) and isinstance(v2, str)):
+        return False
+    date1 = field_date(v1, key, in_mrz)
+    return date1 is not None and date1 == field_date(v2, key, in_mrz)
+
+def diff_passport_json(json1, json2):
+    """
+    Compare two passport JSON objects field by field. Dates written in different
+    formats (e.g. "12/06/2014" and "2014-06-12", or the MRZ birth and expiry fields
+    "140612") are not reported as differences.
+    Returns a dict mapping each differing key to its ground truth and uploaded values.
     """
-    if not json1 or not json2:
-        return "One or both JSON outputs are missing."
-    
     differences = {}
     all_keys = set(json1.keys()).union(set(json2.keys()))
     for key in all_keys:
         v1 = json1.get(key, "<missing>")
         v2 = json2.get(key, "<missing>")
-        if v1 != v2:
+        if not same_value(v1, v2, key):
             differences[key] = {"ground_truth": v1, "uploaded": v2}
+    return differences
+
+def compare_passport_json(json1, json2):
+    """
+    Compare two passport JSON objects field by field.
+    Returns a string summarizing and highlighting the differences.
+    """
+    if not json1 or not json2:
+        return "One or both JSON outputs are missing."
+    
+    differences = diff_passport_json(json1, json2)
     
     if not differences:
         return "The JSON outputs are identical."
@@ -97,11 +140,108 @@ def compare_passport_json(json1, json2):
         diff_str += f"**{key}**:\n - Ground Truth: {diff['ground_truth']}\n - Uploaded: {diff['uploaded']}\n"
     return diff_str
 
+def has_unclear_values(data):
+    """Return True if any value in the (possibly nested) extraction output is 'unclear'."""
+    if isinstance(data, dict):
+        return any(has_unclear_values(v) for v in data.values())
+    if isinstance(data, list):
+        return any(has_unclear_values(v) for v in data)
+    return isinstance(data, str) and data.strip().lower() == "unclear"
+
+def extract_passport_data_tiered(image_path, client, schema=None, escalate=False):
+    """
+    Extract passport data with the fast model first, escalating to the large model
+    if the fast model fails or returns 'unclear' values.
+    Pass escalate=True to skip the fast model (e.g. for low-quality scans).
+    Returns a tuple (data, model_used).
+    """
+    if not escalate:
+        data = extract_passport_data(image_path, client, EXTRACT_MODEL, schema=schema)
+        if data and not has_unclear_values(data):
+            return data, EXTRACT_MODEL
+        print(f"Escalating extraction of {image_path} to {ESCALATION_MODEL}.")
+    return extract_passport_data(image_path, client, ESCALATION_MODEL, schema=schema), ESCALATION_MODEL
+
+def route_passport_comparison(ground_truth_path, uploaded_path, client, quality_score=None):
+    """
+    Extract and compare the ground truth and uploaded passports.
+    In "tiered" routing mode the cheaper models are used first, and the large model is only
+    used when the output contains 'unclear' values, the JSON diff is non-empty (both
+    passports are then re-extracted with it, so only differences confirmed by the large
+    model are reported), or the uploaded scan's quality score is below MIN_QUALITY_SCORE.
+    In "fixed" mode the original model assignment is used.
+    
+    Both images are deskewed and normalized first (cached next to the originals).
+    
+    Returns a tuple (ground_truth_data, uploaded_data, json_comparison, image_comparison),
+    or None if data could not be extracted from one of the images.
+    """
+    ground_truth_path = get_preprocessed_image(ground_truth_path)
+    uploaded_path = get_preprocessed_image(uploaded_path)
+
+    if ROUTING_MODE == "fixed":
+        ground_truth_data = extract_passport_data(ground_truth_path, client, EXTRACT_MODEL)
+        if not ground_truth_data:
+            print("Error: Could not extract data from the ground truth passport image.")
+            return None
+        schema = json.dumps(ground_truth_data, indent=2)
+        uploaded_data = extract_passport_data(uploaded_path, client, EXTRACT_MODEL, schema=schema)
+        if not uploaded_data:
+            print("Error: Could not extract data from the uploaded passport image.")
+            return None
+        json_comparison = compare_passport_json(ground_truth_data, uploaded_data)
+        image_comparison = compare_images(ground_truth_path, uploaded_path, client, IMAGE_COMPARE_MODEL)
+        return ground_truth_data, uploaded_data, json_comparison, image_comparison
+
+    low_quality = quality_score is not None and quality_score < MIN_QUALITY_SCORE
+
+    ground_truth_data, ground_truth_model = extract_passport_data_tiered(ground_truth_path, client)
+    if not ground_truth_data:
+        print("Error: Could not extract data from the ground truth passport image.")
+        return None
+    schema = json.dumps(ground_truth_data, indent=2)
+
+    uploaded_data, uploaded_model = extract_passport_data_tiered(uploaded_path, client, schema=schema, escalate=low_quality)
+    if not uploaded_data:
+        print("Error: Could not extract data from the uploaded passport image.")
+        return None
+
+    # A difference found by the fast model may be a misread rather than a discrepancy:
+    # re-extract with the large model before reporting it
+    if diff_passport_json(ground_truth_data, uploaded_data) and EXTRACT_MODEL in (ground_truth_model, uploaded_model):
+        print(f"Extractions differ; re-extracting with {ESCALATION_MODEL} before reporting differences.")
+        if ground_truth_model != ESCALATION_MODEL:
+            ground_truth_data, ground_truth_model = extract_passport_data_tiered(ground_truth_path, client, escalate=True)
+            if not ground_truth_data:
+                print("Error: Could not extract data from the ground truth passport image.")
+                return None
+            schema = json.dumps(ground_truth_data, indent=2)
+        uploaded_data, uploaded_model = extract_passport_data_tiered(uploaded_path, client, schema=schema, escalate=True)
+        if not uploaded_data:
+            print("Error: Could not extract data from the uploaded passport image.")
+            return None
+
+    json_comparison = compare_passport_json(ground_truth_data, uploaded_data)
+
+    # Only clean scans with identical extractions are compared with the fast model
+    escalate_compare = low_quality or bool(diff_passport_json(ground_truth_data, uploaded_data)) \
+        or ESCALATION_MODEL in (ground_truth_model, uploaded_model)
+    compare_model = IMAGE_COMPARE_MODEL if escalate_compare else FAST_IMAGE_COMPARE_MODEL
+    print(f"Routing: extraction={uploaded_model}, image comparison={compare_model}")
+    image_comparison = compare_images(ground_truth_path, uploaded_path, client, compare_model)
+    return ground_truth_data, uploaded_data, json_comparison, image_comparison
+
 def compare_images(image_path1, image_path2, client, model):
     """
     Use the LLM to compare two passport images.
-    Returns the LLM's response as a string.
+    Identical images and clear mismatches (perceptual hash + SSIM) are decided locally
+    without a model call; everything else is sent to the LLM.
+    Returns the comparison as a string.
     """
+    local = compare_images_locally(image_path1, image_path2)
+    if local["decision"] != "ambiguous":
+        return describe_local_comparison(local, subject="passport images")
+
     encoded_image1 = encode_image(image_path1)
     encoded_image2 = encode_image(image_path2)
     
@@ -133,12 +273,8 @@ def compare_images(image_path1, image_path2, client, model):
     except Exception as e:
         return f"Error during image comparison: {e}"
 
-def analyze_comparisons(json_comparison, image_comparison, client, model):
-    """
-    Combine the JSON and image comparisons to provide a final analysis.
-    Returns the LLM's analysis as a concise response (maximum two sentences)
-    that also recommends asking the applicant for clarifications if needed.
-    """
+def comparison_analysis_messages(json_comparison, image_comparison):
+    """Prompt for the final analysis, shared by `analyze_comparisons` and its streaming variant."""
     prompt_text = (
         "Based on the following comparisons, provide a concise final analysis in no more than two sentences. "
         "If any details are unclear, recommend that the visa officer ask the applicant for further clarification.\n\n"
@@ -146,17 +282,23 @@ def analyze_comparisons(json_comparison, image_comparison, client, model):
         "Image Comparison:\n" + image_comparison
     )
     
-    messages = [
+    return [
         {
             "role": "user",
             "content": [{"type": "text", "text": prompt_text}]
         }
     ]
-    
+
+def analyze_comparisons(json_comparison, image_comparison, client, model):
+    """
+    Combine the JSON and image comparisons to provide a final analysis.
+    Returns the LLM's analysis as a concise response (maximum two sentences)
+    that also recommends asking the applicant for clarifications if needed.
+    """
     try:
         response = client.chat.complete(
             model=model,
-            messages=messages,
+            messages=comparison_analysis_messages(json_comparison, image_comparison),
             temperature=0.0,
             response_format={"type": "text"}
         )
@@ -164,6 +306,22 @@ def analyze_comparisons(json_comparison, image_comparison, client, model):
     except Exception as e:
         return f"Error during analysis: {e}"
 
+def stream_analyze_comparisons(json_comparison, image_comparison, client, model):
+    """
+    Streaming variant of `analyze_comparisons`: yields the analysis text as it is
+    generated. Closing the generator cancels the request.
+    """
+    try:
+        yield from stream_chat_text(
+            client,
+            model=model,
+            messages=comparison_analysis_messages(json_comparison, image_comparison),
+            temperature=0.0,
+            response_format={"type": "text"}
+        )
+    except Exception as e:
+        yield f"Error during analysis: {e}"
+
 def classify_application(json_comparison, image_comparison, client, model):
     """
     Classify the passport application into one of three classes: green, yellow, or red.
@@ -209,6 +367,11 @@ def classify_application(json_comparison, image_comparison, client, model):
         return None
 
 def main():
+    # Shared, rate-limited Mistral client (also loads the .env file)
+    client = get_client()
+    if client is None:
+        sys.exit(1)
+
     # Read passport image paths from environment variables
     uploaded_path = os.getenv("UPLOADED_PASSPORT_PATH")
     ground_truth_path = os.getenv("GROUND_TRUTH_PASSPORT_PATH")
@@ -217,30 +380,25 @@ def main():
         print("Error: UPLOADED_PASSPORT_PATH and/or GROUND_TRUTH_PASSPORT_PATH not set in .env file.")
         sys.exit(1)
     
-    # Step 1: Extract passport data from the ground truth passport
-    print("Extracting data from ground truth passport...")
-    ground_truth_data = extract_passport_data(ground_truth_path, client, EXTRACT_MODEL)
-    if not ground_truth_data:
-        print("Error: Could not extract data from the ground truth passport image.")
+    # Step 0: Screen the uploaded scan locally before spending any model calls on it
+    quality = assess_image_quality(uploaded_path)
+    print(f"Uploaded passport quality score: {quality['score']}")
+    if not quality["acceptable"]:
+        print("Error: The uploaded passport scan is unusable:")
+        for issue in quality["issues"]:
+            print(f" - {issue}")
         sys.exit(1)
     
-    # Copy the JSON schema from the ground truth extraction
-    schema = json.dumps(ground_truth_data, indent=2)
-    
-    # Step 2: Extract passport data from the uploaded passport using the ground truth schema
-    print("Extracting data from uploaded passport using the ground truth schema...")
-    uploaded_data = extract_passport_data(uploaded_path, client, EXTRACT_MODEL, schema=schema)
-    if not uploaded_data:
-        print("Error: Could not extract data from the uploaded passport image.")
+    # Steps 1-4: Extract both passports (the uploaded one using the ground truth schema),
+    # compare the JSON outputs and compare the images, routing between fast and large models
+    print("Extracting and comparing passports...")
+    routed = route_passport_comparison(ground_truth_path, uploaded_path, client, quality_score=quality["score"])
+    if not routed:
         sys.exit(1)
-    
-    # Step 3: Compare the JSON outputs
-    json_comparison = compare_passport_json(ground_truth_data, uploaded_data)
+    ground_truth_data, uploaded_data, json_comparison, image_comparison = routed
     print("JSON Comparison:")
     print(json_comparison)
     
-    # Step 4: Compare the images via LLM using the 'pixtral-large-latest' model
-    image_comparison = compare_images(ground_truth_path, uploaded_path, client, IMAGE_COMPARE_MODEL)
     print("Image Comparison:")
     print(image_comparison)
     
@@ -1,9 +1,36 @@
 import os
+import sys
+import importlib
 import streamlit as st
 from dotenv import load_dotenv
 from datetime import datetime
-from pages import home, applications, evaluation, resources
+
+# Load environment variables from .env file (before the modules that read their settings from it)
+load_dotenv()
+
+# Make the repository root importable (for the shared candidate data layout and the
+# document_processor package); module imports run once per process, not on every rerun
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
+
 from utils.data import load_applications_data
+from utils.aggregates import build_aggregates
+from utils.events import replay_events
+
+OFFICER_NAME = os.getenv("OFFICER_NAME", "Jane Wilson")
+
+PAGES = ("home", "applications", "evaluation", "resources")
+
+
+def load_page(name):
+    """
+    Import a page module the first time it is shown. The evaluation page pulls in the
+    image and document processing dependencies, so they are only loaded when an
+    officer opens an application; afterwards the module is served from sys.modules.
+    """
+    return importlib.import_module(f"pages.{name}")
+
 
 # Configure the page
 st.set_page_config(
@@ -29,13 +56,16 @@ with header_cols[2]:
     st.button("Applications", on_click=lambda: setattr(st.session_state, "page", "applications"))
 
 with header_cols[4]:
-    st.write("**Officer:** Jane Wilson", unsafe_allow_html=True)
+    st.write(f"**Officer:** {OFFICER_NAME}", unsafe_allow_html=True)
     st.write(f"**Date:** {datetime.now().strftime('%Y-%m-%d')}", unsafe_allow_html=True)
 
 # Initialize session state
 if "page" not in st.session_state:
     st.session_state.page = "home"
 
+if "officer" not in st.session_state:
+    st.session_state.officer = OFFICER_NAME
+
 # Load applications data from user/data directory
 data_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'candidate', 'data'))
 print(f"Data directory path: {data_directory}")
@@ -44,6 +74,21 @@ if "applications" not in st.session_state:
     st.session_state.applications = load_applications_data(st, data_directory)
     print(st.session_state.applications)
 
+# Dashboard counters, kept up to date by every status transition, and the evaluation
+# state recorded in the shared event log (replayed onto the loaded applications)
+if "aggregates" not in st.session_state:
+    st.session_state.aggregates = build_aggregates(st.session_state.applications)
+    st.session_state.evaluation_feedback = {}
+    st.session_state.overall_feedback = {}
+    st.session_state.event_log_offset = 0
+
+# Apply the actions logged since the last run, including those of other officers
+st.session_state.event_log_offset = replay_events(
+    st.session_state.applications, st.session_state.aggregates,
+    st.session_state.evaluation_feedback, st.session_state.overall_feedback,
+    offset=st.session_state.event_log_offset,
+)
+
 if "current_application" not in st.session_state:
     st.session_state.current_application = None
 
@@ -68,16 +113,7 @@ if not st.session_state.applications.empty:
             st.session_state.notifications.append(notification)
             st.toast(notification)
 
-# Load environment variables from .env file
-load_dotenv()
-
 # Main content based on the selected page
-if st.session_state.page == "home":
-    home.show()
-elif st.session_state.page == "applications":
-    applications.show()
-elif st.session_state.page == "evaluation":
-    evaluation.show()
-elif st.session_state.page == "resources":
-    resources.show()
+if st.session_state.page in PAGES:
+    load_page(st.session_state.page).show()
 
@@ -1,6 +1,6 @@
 import streamlit as st
 from utils.registry import PERSONAL_INFO_REGISTRY
-from .evaluation import save_personal_info_feedback
+from utils.feedback import save_personal_info_feedback
 
 def show():
     st.title("Applications")
@@ -4,28 +4,21 @@ from datetime import datetime
 
 def show():
     st.title("Visa Officer Dashboard")
-    # Dashboard stats
-    col1, col2, col3 = st.columns(3)
+    # Dashboard stats (precomputed, see utils/aggregates.py)
+    aggregates = st.session_state.aggregates
+    col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.metric(
-            "Pending Applications",
-            len(
-                st.session_state.applications[
-                    st.session_state.applications["status"] != "Completed"
-                ]
-            ),
-        )
+        st.metric("Pending Applications", aggregates.pending())
     with col2:
-        st.metric(
-            "Completed Today",
-            len(
-                st.session_state.applications[
-                    st.session_state.applications["status"] == "Completed"
-                ]
-            ),
-        )
+        st.metric("Completed Today", aggregates.completed_on())
     with col3:
         st.metric("New Assignments", len(st.session_state.notifications))
+    with col4:
+        median_hours = aggregates.median_hours_to_decision()
+        st.metric(
+            "Median Time to Decision",
+            f"{median_hours / 24:.1f} days" if median_hours is not None else "–",
+        )
 
     # # New assignments
     # st.subheader("New Application Assigned")
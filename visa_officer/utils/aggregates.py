@@ -0,0 +1,102 @@
+"""
+Incrementally maintained dashboard aggregates.
+Built once per session from the applications DataFrame and then updated on every
+status transition replayed from the shared event log (see utils/events.py), so the
+dashboard reads its numbers in constant time and includes the decisions of all officers.
+Only applications with a real submission time count towards the median time to decision.
+"""
+
+import bisect
+from collections import Counter
+from datetime import datetime
+from candidate.storage import is_time_ordered_appid, appid_timestamp
+
+COMPLETED = "Completed"
+
+
+class DashboardAggregates:
+    """Counts by status, visa type, decision day and officer, plus the median time to decision."""
+
+    def __init__(self):
+        self.by_status = Counter()
+        self.by_visa_type = Counter()
+        self.completed_by_day = Counter()      # "YYYY-MM-DD" -> decisions made that day
+        self.completed_by_officer = Counter()
+        self.status_of = {}                    # application_id -> current status
+        self.decisions = {}                    # application_id -> (day, officer, hours to decision)
+        self._decision_hours = []              # Sorted, for the median
+
+    def add_application(self, app_id, status, visa_type):
+        """Register an application in its current status (decision time unknown)."""
+        self.status_of[app_id] = status
+        self.by_status[status] += 1
+        self.by_visa_type[visa_type] += 1
+
+    def record_transition(self, app_id, new_status, officer, submitted_at=None, at=None):
+        """Move an application to `new_status`, updating the decision counters if it was completed or reopened."""
+        old_status = self.status_of.get(app_id)
+        if old_status == new_status:
+            return
+        if old_status is not None:
+            self.by_status[old_status] -= 1
+        self.by_status[new_status] += 1
+        self.status_of[app_id] = new_status
+
+        # Reopened (or re-decided): withdraw the previous decision
+        if app_id in self.decisions:
+            day, previous_officer, hours = self.decisions.pop(app_id)
+            self.completed_by_day[day] -= 1
+            self.completed_by_officer[previous_officer] -= 1
+            if hours is not None:
+                del self._decision_hours[bisect.bisect_left(self._decision_hours, hours)]
+
+        if new_status == COMPLETED:
+            at = at or datetime.now().astimezone()
+            day = at.date().isoformat()
+            hours = (at - submitted_at).total_seconds() / 3600 if submitted_at else None
+            self.decisions[app_id] = (day, officer, hours)
+            self.completed_by_day[day] += 1
+            self.completed_by_officer[officer] += 1
+            if hours is not None:
+                bisect.insort(self._decision_hours, hours)
+
+    def pending(self):
+        """Number of applications that are not completed."""
+        return len(self.status_of) - self.by_status[COMPLETED]
+
+    def completed_on(self, day=None):
+        """Number of decisions made on `day` (a date; defaults to today)."""
+        day = day or datetime.now().astimezone().date()
+        return self.completed_by_day[day.isoformat()]
+
+    def median_hours_to_decision(self):
+        """Median hours from submission to decision, or None if no timed decisions exist."""
+        hours = self._decision_hours
+        if not hours:
+            return None
+        middle = len(hours) // 2
+        return hours[middle] if len(hours) % 2 else (hours[middle - 1] + hours[middle]) / 2
+
+
+def submitted_at(app_id, submission_date=None):
+    """
+    Submission time of an application: encoded in time-ordered IDs, else from the
+    submission date stored in the record. None if neither is known.
+    """
+    if is_time_ordered_appid(app_id):
+        return appid_timestamp(app_id)
+    try:
+        return datetime.fromisoformat(str(submission_date)).astimezone()
+    except ValueError:
+        return None
+
+
+def build_aggregates(applications):
+    """Build the aggregates from the applications DataFrame (one pass, once per session)."""
+    aggregates = DashboardAggregates()
+    if applications.empty:
+        return aggregates
+    visa_types = applications["visa_type"] if "visa_type" in applications.columns else ["Unknown"] * len(applications)
+    for app_id, status, visa_type in zip(applications["application_id"], applications["status"], visa_types):
+        aggregates.add_application(app_id, status, visa_type)
+    return aggregates
@@ -4,7 +4,18 @@ Utility functions for data handling
 
 import pandas as pd
 import os
-import json
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from candidate.storage import appid_timestamp, is_time_ordered_appid, iter_application_dirs, read_application_file
+
+# Threads used to parse application files (I/O bound, so more than the CPU count helps)
+LOADER_WORKERS = int(os.getenv("LOADER_WORKERS", str(min(32, (os.cpu_count() or 1) * 4))))
+
+# Shown for legacy applications that record no submission date; not counted in the dashboard median
+SUBMISSION_DATE_UNKNOWN = "Unknown"
+# Placeholder earlier versions of this loader wrote into every record; it is not a real submission date
+PLACEHOLDER_SUBMISSION_DATE = "2022-12-15"
 
 def initialize_data():
     """Initialize sample application data"""
@@ -137,91 +148,83 @@ def initialize_data():
         }
     )
 
+def _load_application(app_id, app_dir):
+    """
+    Load and normalize one application. Runs on a worker thread, so it does not touch Streamlit.
+    The normalization is only applied in memory: the record is never written back, so fields
+    added concurrently by the analysis worker cannot be lost.
+    Returns (outcome, processed_data or error message).
+    """
+    try:
+        app_data = read_application_file(app_dir)
+        if app_data is None:
+            return "missing", None
+
+        # Create a new dictionary with required fields
+        processed_data = {
+            'application_id': app_id,
+            'status': 'Not Started',
+            'document_status': 'Pending',
+            'personal_info_status': 'Pending',
+            'criminal_history_status': 'Pending',
+            'officer_notes': '',
+            'name': '',
+            'nationality': ''
+        }
+
+        # Add the original application data
+        processed_data.update(app_data)
+        processed_data['name'] = processed_data['PersonalInformation']['FirstName'] + " " + processed_data['PersonalInformation']['Surname']
+        processed_data['nationality'] = processed_data['PersonalInformation']['CurrentNationality']
+        if processed_data.get('submission_date', PLACEHOLDER_SUBMISSION_DATE) == PLACEHOLDER_SUBMISSION_DATE:
+            # Time-ordered IDs encode their submission time
+            processed_data['submission_date'] = (appid_timestamp(app_id).isoformat() if is_time_ordered_appid(app_id)
+                                                 else SUBMISSION_DATE_UNKNOWN)
+        return "loaded", processed_data
+
+    except ValueError as e:  # Malformed JSON or compact record
+        return "error", f"Error reading application data for {app_id}: {str(e)}"
+    except Exception as e:
+        return "error", f"Unexpected error processing application {app_id}: {str(e)}"
+
+
 def load_applications_data(st, data_dir):
     """
     Load applications data from user/data directory.
-    Each subdirectory is an application ID containing application.json and uploaded files.
+    Each application directory (in a date or legacy hash shard, or flat before migration)
+    is named by its application ID and contains the application record and uploaded files.
+    Files are parsed concurrently on LOADER_WORKERS threads and the DataFrame is built once.
     """
-    applications_data = []
-    
     # Check if data directory exists and print absolute path
     data_dir = os.path.abspath(data_dir)
     print(f"Looking for data in: {data_dir}")
-    
+
     if not os.path.exists(data_dir):
         st.error(f"Data directory not found: {data_dir}")
         return pd.DataFrame()
-    
-    # Print list of directories found
-    subdirs = os.listdir(data_dir)
-    print(f"Found directories: {subdirs}")
-    
-    # Iterate through all subdirectories in the data directory
-    for app_id in subdirs:
-        app_dir = os.path.join(data_dir, app_id)
-        
-        # Skip if not a directory
-        if not os.path.isdir(app_dir):
-            print(f"Skipping {app_id} - not a directory")
-            continue
-            
-        # Path to application.json
-        json_path = os.path.join(app_dir, "application_data.json")
-        print(f"Looking for application_data.json in: {json_path}")
-        
-        # Skip if application.json doesn't exist
-        if not os.path.exists(json_path):
-            print(f"Skipping {app_id} - application_data.json not found")
-            continue
-            
-        try:
-            # Load application data
-            with open(json_path, 'r') as file:
-                app_data = json.load(file)
-            print(f"Successfully loaded data for application {app_id}")
-            
-            # Create a new dictionary with required fields
-            processed_data = {
-                'application_id': app_id,
-                'status': 'Not Started',
-                'document_status': 'Pending',
-                'personal_info_status': 'Pending',
-                'criminal_history_status': 'Pending',
-                'officer_notes': '',
-                'name': '',
-                'nationality': ''
-            }
-            
-            # Add the original application data
-            processed_data.update(app_data)
-            processed_data['name'] = processed_data['PersonalInformation']['FirstName'] + " " + processed_data['PersonalInformation']['Surname']
-            processed_data['nationality'] = processed_data['PersonalInformation']['CurrentNationality']
-            processed_data['submission_date'] = '2022-12-15'
-            
-            # Add the application data to our list
-            applications_data.append(processed_data)
-            print(f"Added application {app_id} to applications_data")
-            
-            # Save the updated data back to the JSON file
-            with open(json_path, 'w') as file:
-                json.dump(processed_data, file, indent=4)
-            
-        except json.JSONDecodeError as e:
-            st.error(f"Error reading application data for {app_id}: {str(e)}")
-            print(f"JSON decode error for {app_id}: {str(e)}")
-        except Exception as e:
-            st.error(f"Unexpected error processing application {app_id}: {str(e)}")
-            print(f"Unexpected error for {app_id}: {str(e)}")
-
-        print()
-    
-    # Print final data
-    print(f"Total applications loaded: {len(applications_data)}")
-    
+
+    # Parse all application directories in parallel (results keep the directory order)
+    started = time.perf_counter()
+    counts = Counter()
+    applications_data = []
+    with ThreadPoolExecutor(max_workers=LOADER_WORKERS) as executor:
+        results = executor.map(lambda entry: _load_application(*entry), iter_application_dirs(data_dir))
+        for outcome, result in results:
+            counts[outcome] += 1
+            if outcome == "error":
+                st.error(result)
+                print(result)
+            elif result is not None:
+                applications_data.append(result)
+
+    print(f"Total applications loaded: {len(applications_data)} in {time.perf_counter() - started:.2f}s "
+          f"({counts['missing']} without an application record, "
+          f"{counts['error']} errors)")
+
     # Convert to DataFrame
     if applications_data:
-        df = pd.DataFrame(applications_data)
-        
+        df = pd.DataFrame.from_records(applications_data)
+
         # Ensure all required columns exist with default values
         required_columns = {
             'application_id': '',
@@ -231,11 +234,11 @@ def load_applications_data(st, data_dir):
             'criminal_history_status': 'Pending',
             'officer_notes': ''
         }
-        
+
         for col, default_value in required_columns.items():
             if col not in df.columns:
                 df[col] = default_value
-        
+
         print(f"Created DataFrame with {len(df)} rows")
         return df
     else:
@@ -0,0 +1,122 @@
+"""
+Append-only log of evaluation actions (section approvals, feedback, rejections and
+final decisions). Every action is one JSON line, so recording it is a cheap append;
+the per-application evaluation state and the dashboard aggregates are rebuilt at
+session start by replaying the log, which doubles as an audit trail, and every later
+run replays only the events appended since, so all officers see each other's actions.
+"""
+
+import os
+import json
+import threading
+from datetime import datetime
+from utils.aggregates import submitted_at
+
+EVENT_LOG = os.getenv(
+    "EVALUATION_EVENT_LOG",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "evaluation_events.jsonl"),
+)
+
+SECTION_FIELDS = ("personal_info_status", "document_status", "criminal_history_status")
+
+_write_lock = threading.Lock()
+
+
+def append_event(event_type, app_id, officer, **details):
+    """Append one evaluation action to the log and return it."""
+    event = {
+        "ts": datetime.now().astimezone().isoformat(),
+        "type": event_type,
+        "app_id": app_id,
+        "officer": officer,
+        **details,
+    }
+    line = json.dumps(event) + "\n"
+    with _write_lock:
+        os.makedirs(os.path.dirname(EVENT_LOG), exist_ok=True)
+        with open(EVENT_LOG, "a") as f:
+            f.write(line)
+            f.flush()
+    return event
+
+
+def read_events(path=EVENT_LOG, offset=0):
+    """
+    Yield (event, offset after it) for the events logged from byte `offset` on. An
+    incomplete final line (still being appended) is left for the next read.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                return
+            offset += len(line)
+            try:
+                yield json.loads(line), offset
+            except json.JSONDecodeError:
+                print(f"Skipping unreadable event ending at byte {offset} of {path}")
+
+
+def overall_status(personal, document, criminal):
+    """Overall application status from the three section statuses."""
+    if personal == 'Approved' and document == 'Approved' and criminal == 'Approved':
+        return 'Completed'
+    elif personal == 'Rejected' or document == 'Rejected' or criminal == 'Rejected':
+        return 'Completed'
+    return 'In Progress'
+
+
+def apply_status(applications, aggregates, index, field, status, officer, at=None):
+    """
+    Set one section status of the application at `index`, recompute its overall
+    status and update the aggregates. Shared by live actions and replay.
+    """
+    applications.at[index, field] = status
+    new_status = overall_status(*(applications.at[index, section] for section in SECTION_FIELDS))
+    applications.at[index, 'status'] = new_status
+
+    app_id = applications.at[index, 'application_id']
+    submission_date = applications.at[index, 'submission_date'] if 'submission_date' in applications.columns else None
+    aggregates.record_transition(app_id, new_status, officer,
+                                 submitted_at=submitted_at(app_id, submission_date), at=at)
+
+
+def replay_events(applications, aggregates, evaluation_feedback, overall_feedback, path=EVENT_LOG, offset=0):
+    """
+    Replay the events logged from byte `offset` on onto the loaded applications
+    DataFrame, the aggregates, the section feedback per application and the last
+    final decision per application (all updated in place). Called with offset 0 at
+    session start and then on every run with the returned offset, so actions of other
+    officers show up; re-applying this session's own actions changes nothing.
+
+    Returns:
+        int: the offset up to which the log has been replayed.
+    """
+    if applications.empty:
+        return offset
+
+    positions = {app_id: index for index, app_id in applications['application_id'].items()}
+    replayed = 0
+    for event, offset in read_events(path, offset):
+        index = positions.get(event.get("app_id"))
+        if index is None:
+            continue  # Application no longer exists
+        if event["type"] == "status":
+            apply_status(applications, aggregates, index, event["field"], event["status"], event["officer"],
+                         at=datetime.fromisoformat(event["ts"]))
+        elif event["type"] == "feedback":
+            applications.at[index, 'officer_notes'] = event["feedback"]
+            evaluation_feedback.setdefault(event["app_id"], {})[event["field"]] = event["feedback"]
+        elif event["type"] == "final_decision":
+            overall_feedback[event["app_id"]] = {
+                'status': event["status"],
+                'feedback': event["feedback"],
+                'timestamp': event["ts"],
+            }
+        replayed += 1
+
+    if replayed:
+        print(f"Replayed {replayed} evaluation events from {path}")
+    return offset
@@ -0,0 +1,21 @@
+"""
+Feedback written back to the application record from the applications and
+evaluation pages.
+"""
+
+import streamlit as st
+from candidate.storage import update_application
+
+
+def save_personal_info_feedback(app_id, status, feedback_message):
+    try:
+        # Update automatic_checks directly
+        update_application(app_id, {
+            'automatic_checks': {
+                'status': status.lower(),  # Convert to lowercase to match required format
+                'feedback': feedback_message
+            }
+        })
+
+    except Exception as e:
+        st.error(f"Error updating application data: {str(e)}")